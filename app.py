@@ -1,6 +1,10 @@
 import streamlit as st
-import pandas as pd
-from io import BytesIO
+
+from excelfilter import core
+from excelfilter.export import export_key, prepare_export, prepared_export
+
+# Criterios de la interfaz y su nombre en excelfilter.filters
+CRITERIOS = core.SPANISH_CRITERIA
 
 # Título de la app
 st.title("Filtrar y Guardar Tabla de Excel")
@@ -11,7 +15,7 @@ uploaded_file = st.file_uploader("Sube tu archivo de Excel", type=["xlsx"])
 # Verificar si se ha subido un archivo
 if uploaded_file:
     # Leer la hoja de Excel
-    df = pd.read_excel(uploaded_file)
+    df, dataset_id = core.load_excel(uploaded_file)
 
     # Mostrar la tabla completa
     st.subheader("Tabla Completa")
@@ -34,25 +38,7 @@ if uploaded_file:
                 column = st.selectbox("Columna", df.columns, key=f"col_{i}")
 
             with col2:
-                if df[column].dtype in ["int64", "float64"]:
-                    filter_criteria = [
-                        "Mayor que",
-                        "Menor que",
-                        "Igual a",
-                        "Diferente de",
-                        "Es nulo",
-                        "No es nulo",
-                    ]
-                else:
-                    filter_criteria = [
-                        "Contiene",
-                        "No contiene",
-                        "Empieza con",
-                        "Termina con",
-                        "Es nulo",
-                        "No es nulo",
-                    ]
-
+                filter_criteria = core.criteria_for(df[column], CRITERIOS)
                 filter_criterion = st.selectbox(
                     f"Criterio", filter_criteria, key=f"crit_{i}"
                 )
@@ -73,68 +59,28 @@ if uploaded_file:
 
             filtro = None
 
-            if filter_criterion in [
-                "Mayor que",
-                "Menor que",
-                "Igual a",
-                "Diferente de",
-            ]:
-                try:
-                    filter_value = float(filter_value) if filter_value else None
-                except ValueError:
-                    st.error(
-                        f"Por favor, ingresa un valor numérico válido para {column}."
-                    )
-                    filter_value = None
-
             if (filter_value is not None) or (
                 filter_criterion in ["Es nulo", "No es nulo"]
             ):
-                if df[column].dtype in ["int64", "float64"]:
-                    if filter_criterion == "Mayor que":
-                        filtro = df[column] > filter_value
-                    elif filter_criterion == "Menor que":
-                        filtro = df[column] < filter_value
-                    elif filter_criterion == "Igual a":
-                        filtro = df[column] == filter_value
-                    elif filter_criterion == "Diferente de":
-                        filtro = df[column] != filter_value
-                    elif filter_criterion == "Es nulo":
-                        filtro = df[column].isnull()
-                    elif filter_criterion == "No es nulo":
-                        filtro = df[column].notnull()
-                else:
-                    if filter_criterion == "Contiene":
-                        filtro = df[column].str.contains(
-                            filter_value, case=False, na=False
-                        )
-                    elif filter_criterion == "No contiene":
-                        filtro = ~df[column].str.contains(
-                            filter_value, case=False, na=False
+                try:
+                    filtro = core.build_spec(
+                        df, column, filter_criterion, filter_value, labels=CRITERIOS
+                    )
+                except core.FilterValueError:
+                    # Sin valor el filtro todavía no se aplica
+                    if filter_value:
+                        st.error(
+                            f"Por favor, ingresa un valor numérico válido para {column}."
                         )
-                    elif filter_criterion == "Empieza con":
-                        filtro = df[column].str.startswith(filter_value, na=False)
-                    elif filter_criterion == "Termina con":
-                        filtro = df[column].str.endswith(filter_value, na=False)
-                    elif filter_criterion == "Es nulo":
-                        filtro = df[column].isnull()
-                    elif filter_criterion == "No es nulo":
-                        filtro = df[column].notnull()
+                except core.FilterError:
+                    pass
 
             if filtro is not None:
                 filtros.append(filtro)
 
-    if filtros:
-        filtro_combinado = filtros[0]
-        for i in range(1, len(filtros)):
-            if criterios[i - 1] == "AND":
-                filtro_combinado &= filtros[i]
-            elif criterios[i - 1] == "OR":
-                filtro_combinado |= filtros[i]
-
-        filtered_df = df[filtro_combinado]
-    else:
-        filtered_df = df
+    # Cada criterio une un filtro con los anteriores
+    filtros = core.connect(filtros, criterios)
+    filtered_df = core.apply_filters(df, filtros, dataset_id)
 
     st.subheader("Tabla Filtrada")
     st.dataframe(filtered_df)
@@ -144,22 +90,21 @@ if uploaded_file:
         "Ingresa el nombre del archivo de salida (sin extensión)", "tabla_filtrada"
     )
 
-    # Guardar el archivo filtrado en memoria y crear un enlace de descarga
-    def to_excel(df):
-        output = BytesIO()
-        writer = pd.ExcelWriter(output, engine="xlsxwriter")
-        df.to_excel(writer, index=False, sheet_name="Sheet1")
-        writer.close()
-        processed_data = output.getvalue()
-        return processed_data
-
-    # Convertir el DataFrame a un archivo de Excel
-    filtered_df_to_excel = to_excel(filtered_df)
+    # Convertir el DataFrame a un archivo de Excel solo cuando se pide,
+    # una vez por combinación de filtros
+    clave_excel = export_key(dataset_id, filtros, "xlsx")
+    filtered_df_to_excel = prepared_export(clave_excel)
+    if filtered_df_to_excel is None and st.button("Preparar archivo de Excel"):
+        with st.spinner("Generando el archivo de Excel..."):
+            filtered_df_to_excel = prepare_export(
+                clave_excel, lambda: core.to_excel(filtered_df)
+            )
 
     # Crear enlace de descarga
-    st.download_button(
-        label="Descargar tabla filtrada como Excel",
-        data=filtered_df_to_excel,
-        file_name=f"{output_file_name}.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
\ No newline at end of file
+    if filtered_df_to_excel is not None:
+        st.download_button(
+            label="Descargar tabla filtrada como Excel",
+            data=filtered_df_to_excel.data,
+            file_name=f"{output_file_name}.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        )
\ No newline at end of file
@@ -1,6 +1,10 @@
 import streamlit as st
-import pandas as pd
-from io import BytesIO
+
+from excelfilter import core
+
+# Criterios de la interfaz y su nombre en excelfilter.filters
+CRITERIOS = core.SPANISH_CRITERIA
+
 
 # --- Funciones auxiliares ---
 def cargar_archivo(uploaded_file):
@@ -9,13 +13,14 @@ def cargar_archivo(uploaded_file):
     Args:
         uploaded_file: archivo subido por el usuario.
     Returns:
-        DataFrame cargado con pandas.
+        (DataFrame, identificador del conjunto de datos), o (None, None)
+        si hay un error.
     """
     try:
-        return pd.read_excel(uploaded_file)
+        return core.load_excel(uploaded_file)
     except Exception as e:
         st.error(f"Error al leer el archivo: {e}")
-        return None
+        return None, None
 
 
 def generar_filtro(df, column, criterion, value):
@@ -27,56 +32,28 @@ def generar_filtro(df, column, criterion, value):
         criterion: Criterio de filtro seleccionado.
         value: Valor del filtro.
     Returns:
-        Filtro pandas compatible o None si hay un error.
+        FilterSpec validado o None si hay un error.
     """
-    if criterion in ["Es nulo", "No es nulo"]:
-        return df[column].isnull() if criterion == "Es nulo" else df[column].notnull()
     try:
-        if df[column].dtype in ["int64", "float64"]:
-            value = float(value)
-            if criterion == "Mayor que":
-                return df[column] > value
-            elif criterion == "Menor que":
-                return df[column] < value
-            elif criterion == "Igual a":
-                return df[column] == value
-            elif criterion == "Diferente de":
-                return df[column] != value
-        else:
-            if criterion == "Contiene":
-                return df[column].str.contains(value, case=False, na=False)
-            elif criterion == "No contiene":
-                return ~df[column].str.contains(value, case=False, na=False)
-            elif criterion == "Empieza con":
-                return df[column].str.startswith(value, na=False)
-            elif criterion == "Termina con":
-                return df[column].str.endswith(value, na=False)
-    except Exception as e:
+        return core.build_spec(df, column, criterion, value, labels=CRITERIOS)
+    except core.FilterError as e:
         st.error(f"Error al aplicar el filtro: {e}")
     return None
 
 
-def aplicar_filtros(df, filtros, criterios):
+def aplicar_filtros(df, filtros, criterios, dataset_id=None):
     """
     Combina los filtros aplicados al DataFrame según los criterios.
     Args:
         df: DataFrame original.
-        filtros: Lista de filtros pandas.
-        criterios: Lista de criterios ("AND", "OR").
+        filtros: Lista de FilterSpec.
+        criterios: Lista de criterios ("AND", "OR"); criterios[i] une
+            filtros[i + 1] con los anteriores.
+        dataset_id: Identificador estable de df para la caché de máscaras.
     Returns:
         DataFrame filtrado.
     """
-    if not filtros:
-        return df
-
-    filtro_combinado = filtros[0]
-    for i in range(1, len(filtros)):
-        if criterios[i - 1] == "AND":
-            filtro_combinado &= filtros[i]
-        elif criterios[i - 1] == "OR":
-            filtro_combinado |= filtros[i]
-
-    return df[filtro_combinado]
+    return core.apply_filters(df, core.connect(filtros, criterios), dataset_id)
 
 
 def exportar_excel(df):
@@ -85,15 +62,9 @@ def exportar_excel(df):
     Args:
         df: DataFrame a exportar.
     Returns:
-        BytesIO con los datos del archivo Excel.
+        Bytes del archivo Excel.
     """
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        df.to_excel(writer, index=False, sheet_name="Sheet1")
-        worksheet = writer.sheets["Sheet1"]
-        for i, col in enumerate(df.columns):
-            worksheet.set_column(i, i, max(len(col) + 2, 12))  # Ajusta el tamaño
-    return output.getvalue()
+    return core.to_excel(df, "Sheet1", core.column_widths(df))
 
 
 # --- Interfaz de usuario ---
@@ -103,7 +74,7 @@ st.title("Filtrar y Guardar Tabla de Excel")
 uploaded_file = st.file_uploader("Sube tu archivo de Excel", type=["xlsx"])
 
 if uploaded_file:
-    df = cargar_archivo(uploaded_file)
+    df, dataset_id = cargar_archivo(uploaded_file)
     if df is not None:
         # Mostrar tabla original
         st.subheader("Tabla Completa")
@@ -127,24 +98,7 @@ if uploaded_file:
                     column = st.selectbox(f"Columna", df.columns, key=f"col_{i}")
 
                 with col2:
-                    if df[column].dtype in ["int64", "float64"]:
-                        filter_criteria = [
-                            "Mayor que",
-                            "Menor que",
-                            "Igual a",
-                            "Diferente de",
-                            "Es nulo",
-                            "No es nulo",
-                        ]
-                    else:
-                        filter_criteria = [
-                            "Contiene",
-                            "No contiene",
-                            "Empieza con",
-                            "Termina con",
-                            "Es nulo",
-                            "No es nulo",
-                        ]
+                    filter_criteria = core.criteria_for(df[column], CRITERIOS)
                     criterion = st.selectbox(
                         f"Criterio", filter_criteria, key=f"crit_{i}"
                     )
@@ -168,7 +122,7 @@ if uploaded_file:
 
         # Aplicar filtros
         if st.button("Aplicar Filtros"):
-            filtered_df = aplicar_filtros(df, filtros, criterios)
+            filtered_df = aplicar_filtros(df, filtros, criterios, dataset_id)
             st.subheader("Tabla Filtrada")
             st.dataframe(filtered_df)
 
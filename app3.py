@@ -1,6 +1,10 @@
 import streamlit as st
-import pandas as pd
-from io import BytesIO
+
+from excelfilter import core
+
+# Criterios de la interfaz y su nombre en excelfilter.filters
+CRITERIOS = core.SPANISH_CRITERIA
+
 
 # --- Funciones auxiliares ---
 def cargar_archivo(uploaded_file):
@@ -9,13 +13,14 @@ def cargar_archivo(uploaded_file):
     Args:
         uploaded_file: archivo subido por el usuario.
     Returns:
-        DataFrame cargado con pandas.
+        (DataFrame, identificador del conjunto de datos), o (None, None)
+        si hay un error.
     """
     try:
-        return pd.read_excel(uploaded_file)
+        return core.load_excel(uploaded_file)
     except Exception as e:
         st.error(f"Error al leer el archivo: {e}")
-        return None
+        return None, None
 
 
 def generar_filtro(df, column, criterion, value):
@@ -27,63 +32,31 @@ def generar_filtro(df, column, criterion, value):
         criterion: Criterio de filtro seleccionado.
         value: Valor del filtro.
     Returns:
-        Filtro pandas compatible o None si hay un error.
+        FilterSpec validado o None si hay un error.
     """
     try:
-        match criterion:
-            case "Es nulo":
-                return df[column].isnull()
-            case "No es nulo":
-                return df[column].notnull()
-            case "Mayor que" if df[column].dtype in ["int64", "float64"]:
-                return df[column] > float(value)
-            case "Menor que" if df[column].dtype in ["int64", "float64"]:
-                return df[column] < float(value)
-            case "Igual a" if df[column].dtype in ["int64", "float64"]:
-                return df[column] == float(value)
-            case "Diferente de" if df[column].dtype in ["int64", "float64"]:
-                return df[column] != float(value)
-            case "Contiene" if df[column].dtype == "object":
-                return df[column].str.contains(value, case=False, na=False)
-            case "No contiene" if df[column].dtype == "object":
-                return ~df[column].str.contains(value, case=False, na=False)
-            case "Empieza con" if df[column].dtype == "object":
-                return df[column].str.startswith(value, na=False)
-            case "Termina con" if df[column].dtype == "object":
-                return df[column].str.endswith(value, na=False)
-            case _:
-                st.error(f"Criterio '{criterion}' no válido para la columna seleccionada.")
-                return None
-    except ValueError:
+        return core.build_spec(df, column, criterion, value, labels=CRITERIOS)
+    except core.FilterValueError:
         st.error(f"El valor ingresado no es válido para el criterio '{criterion}'.")
         return None
-    except Exception as e:
-        st.error(f"Error al aplicar el filtro: {e}")
+    except core.FilterError:
+        st.error(f"Criterio '{criterion}' no válido para la columna seleccionada.")
         return None
 
 
-def aplicar_filtros(df, filtros, criterios):
+def aplicar_filtros(df, filtros, criterios, dataset_id=None):
     """
     Combina los filtros aplicados al DataFrame según los criterios.
     Args:
         df: DataFrame original.
-        filtros: Lista de filtros pandas.
-        criterios: Lista de criterios ("AND", "OR").
+        filtros: Lista de FilterSpec.
+        criterios: Lista de criterios ("AND", "OR"); criterios[i] une
+            filtros[i + 1] con los anteriores.
+        dataset_id: Identificador estable de df para la caché de máscaras.
     Returns:
         DataFrame filtrado.
     """
-    if not filtros:
-        return df
-
-    filtro_combinado = filtros[0]
-    for i in range(1, len(filtros)):
-        match criterios[i - 1]:
-            case "AND":
-                filtro_combinado &= filtros[i]
-            case "OR":
-                filtro_combinado |= filtros[i]
-
-    return df[filtro_combinado]
+    return core.apply_filters(df, core.connect(filtros, criterios), dataset_id)
 
 
 def exportar_excel(df):
@@ -92,15 +65,9 @@ def exportar_excel(df):
     Args:
         df: DataFrame a exportar.
     Returns:
-        BytesIO con los datos del archivo Excel.
+        Bytes del archivo Excel.
     """
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        df.to_excel(writer, index=False, sheet_name="Sheet1")
-        worksheet = writer.sheets["Sheet1"]
-        for i, col in enumerate(df.columns):
-            worksheet.set_column(i, i, max(len(col) + 2, 12))  # Ajusta el tamaño
-    return output.getvalue()
+    return core.to_excel(df, "Sheet1", core.column_widths(df))
 
 
 # --- Interfaz de usuario ---
@@ -110,7 +77,7 @@ st.title("Filtrar y Guardar Tabla de Excel")
 uploaded_file = st.file_uploader("Sube tu archivo de Excel", type=["xlsx"])
 
 if uploaded_file:
-    df = cargar_archivo(uploaded_file)
+    df, dataset_id = cargar_archivo(uploaded_file)
     if df is not None:
         # Mostrar tabla original
         st.subheader("Tabla Completa")
@@ -133,24 +100,7 @@ if uploaded_file:
                     column = st.selectbox(f"Columna", df.columns, key=f"col_{i}")
 
                 with col2:
-                    if df[column].dtype in ["int64", "float64"]:
-                        filter_criteria = [
-                            "Mayor que",
-                            "Menor que",
-                            "Igual a",
-                            "Diferente de",
-                            "Es nulo",
-                            "No es nulo",
-                        ]
-                    else:
-                        filter_criteria = [
-                            "Contiene",
-                            "No contiene",
-                            "Empieza con",
-                            "Termina con",
-                            "Es nulo",
-                            "No es nulo",
-                        ]
+                    filter_criteria = core.criteria_for(df[column], CRITERIOS)
                     criterion = st.selectbox(
                         f"Criterio", filter_criteria, key=f"crit_{i}"
                     )
@@ -176,7 +126,7 @@ if uploaded_file:
 
         # Aplicar filtros
         if st.button("Aplicar Filtros"):
-            filtered_df = aplicar_filtros(df, filtros, criterios)
+            filtered_df = aplicar_filtros(df, filtros, criterios, dataset_id)
             st.subheader("Tabla Filtrada")
             st.dataframe(filtered_df)
 
@@ -1,6 +1,12 @@
 import streamlit as st
-import pandas as pd
-from io import BytesIO
+
+from excelfilter import core
+from excelfilter.export import export_key, prepare_export, prepared_export
+from excelfilter.indexes import build_text_indexes
+
+# Criterios de la interfaz y su nombre en excelfilter.filters
+CRITERIOS = core.SPANISH_CRITERIA
+
 
 # --- Funciones auxiliares ---
 def cargar_archivo(uploaded_file):
@@ -9,16 +15,17 @@ def cargar_archivo(uploaded_file):
     Args:
         uploaded_file: archivo subido por el usuario.
     Returns:
-        DataFrame cargado con pandas.
+        (DataFrame, identificador del conjunto de datos), o (None, None)
+        si hay un error.
     """
     try:
-        return pd.read_excel(uploaded_file)
+        return core.load_excel(uploaded_file)
     except Exception as e:
         st.error(f"Error al leer el archivo: {e}")
-        return None
+        return None, None
 
 
-def generar_filtro(df, column, criterion, value):
+def generar_filtro(df, column, criterion, value, conector="AND"):
     """
     Genera un filtro basado en la columna, el criterio y el valor.
     Args:
@@ -26,65 +33,37 @@ def generar_filtro(df, column, criterion, value):
         column: Nombre de la columna.
         criterion: Criterio de filtro seleccionado.
         value: Valor del filtro.
+        conector: "AND" u "OR", une este filtro con los anteriores.
     Returns:
-        Filtro pandas compatible o None si hay un error.
+        FilterSpec validado o None si hay un error.
     """
     try:
-        match criterion:
-            case "Es nulo":
-                return df[column].isnull()
-            case "No es nulo":
-                return df[column].notnull()
-            case "Mayor que" if df[column].dtype in ["int64", "float64"]:
-                return df[column] > float(value)
-            case "Menor que" if df[column].dtype in ["int64", "float64"]:
-                return df[column] < float(value)
-            case "Igual a" if df[column].dtype in ["int64", "float64"]:
-                return df[column] == float(value)
-            case "Diferente de" if df[column].dtype in ["int64", "float64"]:
-                return df[column] != float(value)
-            case "Contiene" if df[column].dtype == "object":
-                return df[column].str.contains(value, case=False, na=False)
-            case "No contiene" if df[column].dtype == "object":
-                return ~df[column].str.contains(value, case=False, na=False)
-            case "Empieza con" if df[column].dtype == "object":
-                return df[column].str.startswith(value, na=False)
-            case "Termina con" if df[column].dtype == "object":
-                return df[column].str.endswith(value, na=False)
-            case _:
-                st.error(f"Criterio '{criterion}' no válido para la columna seleccionada.")
-                return None
-    except ValueError:
+        return core.build_spec(df, column, criterion, value, conector, CRITERIOS)
+    except core.FilterValueError:
         st.error(f"El valor ingresado no es válido para el criterio '{criterion}'.")
         return None
-    except Exception as e:
-        st.error(f"Error al aplicar el filtro: {e}")
+    except core.FilterError:
+        st.error(f"Criterio '{criterion}' no válido para la columna seleccionada.")
         return None
 
 
-def aplicar_filtros(df, filtros, criterios):
+def aplicar_filtros(df, filtros, dataset_id=None):
     """
     Combina los filtros aplicados al DataFrame según los criterios.
     Args:
         df: DataFrame original.
-        filtros: Lista de filtros pandas.
-        criterios: Lista de criterios ("AND", "OR").
+        filtros: Lista de FilterSpec (None para filtros no válidos).
+        dataset_id: Identificador estable de df para la caché de máscaras.
     Returns:
         DataFrame filtrado.
     """
-    if not filtros:
+    try:
+        # La máscara se obtiene de la caché compartida, por especificación
+        return core.apply_filters(df, filtros, dataset_id)
+    except Exception as e:
+        st.error(f"Error al aplicar el filtro: {e}")
         return df
 
-    filtro_combinado = filtros[0]
-    for i in range(1, len(filtros)):
-        match criterios[i - 1]:
-            case "AND":
-                filtro_combinado &= filtros[i]
-            case "OR":
-                filtro_combinado |= filtros[i]
-
-    return df[filtro_combinado]
-
 
 def exportar_excel(df):
     """
@@ -92,15 +71,9 @@ def exportar_excel(df):
     Args:
         df: DataFrame a exportar.
     Returns:
-        BytesIO con los datos del archivo Excel.
+        Bytes del archivo Excel.
     """
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        df.to_excel(writer, index=False, sheet_name="Sheet1")
-        worksheet = writer.sheets["Sheet1"]
-        for i, col in enumerate(df.columns):
-            worksheet.set_column(i, i, max(len(col) + 2, 12))  # Ajusta el tamaño
-    return output.getvalue()
+    return core.to_excel(df, "Sheet1", core.column_widths(df))
 
 
 # --- Interfaz de usuario ---
@@ -110,22 +83,24 @@ st.title("Filtrar y Guardar Tabla de Excel")
 uploaded_file = st.file_uploader("Sube tu archivo de Excel", type=["xlsx"])
 
 if uploaded_file:
-    df = cargar_archivo(uploaded_file)
+    df, dataset_id = cargar_archivo(uploaded_file)
     if df is not None:
+        # Los índices de búsqueda de texto se construyen en segundo plano
+        build_text_indexes(df, dataset_id)
+
         # Mostrar tabla original
         st.subheader("Tabla Completa")
         st.dataframe(df)
 
         # Inicializar el estado de los filtros si no existe
+        # En la sesión solo se guardan las especificaciones, no las máscaras
         if 'filtros' not in st.session_state:
             st.session_state.filtros = []
-            st.session_state.criterios = []
             st.session_state.num_filtros = 1
 
         # Botón para resetear filtros
         if st.button("Resetear Filtros"):
             st.session_state.filtros = []
-            st.session_state.criterios = []
             st.session_state.num_filtros = 1
             st.session_state.apply_filters = True
             st.rerun()
@@ -136,6 +111,8 @@ if uploaded_file:
                 "Número de filtros", min_value=1, step=1, value=st.session_state.num_filtros
             )
             
+            filtros = []
+            conector = "AND"
             for i in range(st.session_state.num_filtros):
                 st.write(f"Filtro {i + 1}")
                 col1, col2, col3, col4 = st.columns(4)
@@ -144,24 +121,7 @@ if uploaded_file:
                     column = st.selectbox(f"Columna", df.columns, key=f"col_{i}")
 
                 with col2:
-                    if df[column].dtype in ["int64", "float64"]:
-                        filter_criteria = [
-                            "Mayor que",
-                            "Menor que",
-                            "Igual a",
-                            "Diferente de",
-                            "Es nulo",
-                            "No es nulo",
-                        ]
-                    else:
-                        filter_criteria = [
-                            "Contiene",
-                            "No contiene",
-                            "Empieza con",
-                            "Termina con",
-                            "Es nulo",
-                            "No es nulo",
-                        ]
+                    filter_criteria = core.criteria_for(df[column], CRITERIOS)
                     criterion = st.selectbox(
                         f"Criterio", filter_criteria, key=f"crit_{i}"
                     )
@@ -172,32 +132,22 @@ if uploaded_file:
                     else:
                         value = None
 
-                filtro = generar_filtro(df, column, criterion, value)
-                if filtro is not None:
-                    if i < len(st.session_state.filtros):
-                        st.session_state.filtros[i] = filtro
-                    else:
-                        st.session_state.filtros.append(filtro)
+                filtros.append(generar_filtro(df, column, criterion, value, conector))
 
                 with col4:
+                    # El criterio une este filtro con el siguiente
                     if i < st.session_state.num_filtros - 1:
-                        if i < len(st.session_state.criterios):
-                            st.session_state.criterios[i] = st.radio(
-                                "Criterio", ["AND", "OR"], key=f"crit_radio_{i}"
-                            )
-                        else:
-                            st.session_state.criterios.append(
-                                st.radio(
-                                    "Criterio", ["AND", "OR"], key=f"crit_radio_{i}"
-                                )
-                            )
+                        conector = st.radio(
+                            "Criterio", ["AND", "OR"], key=f"crit_radio_{i}"
+                        )
+            st.session_state.filtros = filtros
 
         # Aplicar filtros automáticamente
         if 'apply_filters' not in st.session_state:
             st.session_state.apply_filters = False
 
         if st.session_state.apply_filters or (len(st.session_state.filtros) > 0 and any(f is not None for f in st.session_state.filtros)):
-            filtered_df = aplicar_filtros(df, st.session_state.filtros, st.session_state.criterios)
+            filtered_df = aplicar_filtros(df, st.session_state.filtros, dataset_id)
             st.subheader("Tabla Filtrada")
             st.dataframe(filtered_df)
 
@@ -206,14 +156,26 @@ if uploaded_file:
                 "Ingresa el nombre del archivo de salida (sin extensión)",
                 "tabla_filtrada",
             )
-            filtered_df_to_excel = exportar_excel(filtered_df)
-
-            st.download_button(
-                label="Descargar tabla filtrada como Excel",
-                data=filtered_df_to_excel,
-                file_name=f"{output_file_name}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            # El archivo solo se genera a pedido, una vez por resultado
+            clave_excel = export_key(
+                dataset_id,
+                [filtro for filtro in st.session_state.filtros if filtro is not None],
+                "xlsx",
             )
+            filtered_df_to_excel = prepared_export(clave_excel)
+            if filtered_df_to_excel is None and st.button("Preparar archivo de Excel"):
+                with st.spinner("Generando el archivo de Excel..."):
+                    filtered_df_to_excel = prepare_export(
+                        clave_excel, lambda: exportar_excel(filtered_df)
+                    )
+
+            if filtered_df_to_excel is not None:
+                st.download_button(
+                    label="Descargar tabla filtrada como Excel",
+                    data=filtered_df_to_excel.data,
+                    file_name=f"{output_file_name}.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                )
 
         # Resetear el estado de apply_filters
         st.session_state.apply_filters = False
@@ -1,114 +1,279 @@
+import math
+
 import streamlit as st
 import pandas as pd
-from io import BytesIO
+from functools import partial
+from pathlib import Path
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from excelfilter import core, settings
+from excelfilter.cache import workbook_cache
+from excelfilter.governor import memory_governor
+from excelfilter.instrument import StageRecorder
+from excelfilter.registry import dataset_registry
+from excelfilter.streaming import DEFAULT_BATCH_ROWS as STREAM_BATCH_ROWS
 
 
 # --- Helper Functions ---
 def load_excel_file(uploaded_file):
     try:
-        # Load all sheets from the Excel file
-        return pd.read_excel(uploaded_file, sheet_name=None)
+        # Only the sheet list is read here; sheets are parsed when selected
+        return core.open_workbook(uploaded_file)
     except Exception as e:
         st.error(f"Error reading the file: {e}")
         return None
 
 
-def generate_filter(df, column, criterion, value):
+def load_sheet(sheets, sheet_name, optimize=False, preview_rows=100):
+    progress = st.empty()
+    preview = st.empty()
+
+    def show_progress(buffer, total_rows):
+        if total_rows:
+            progress.progress(
+                min(buffer.num_rows / total_rows, 1.0),
+                text=f"Reading rows: {buffer.num_rows} of about {total_rows}",
+            )
+        else:
+            progress.write(f"Reading rows: {buffer.num_rows}")
+        # Show the first rows as soon as they are parsed
+        if buffer.num_rows <= STREAM_BATCH_ROWS:
+            preview.dataframe(buffer.head(preview_rows))
+
+    try:
+        # The optimised frame is cached in place of the parsed one
+        if optimize:
+            return sheets.load_optimized(sheet_name, on_batch=show_progress)
+        return sheets.load(sheet_name, on_batch=show_progress), None
+    except Exception as e:
+        st.error(f"Error reading the sheet '{sheet_name}': {e}")
+        return None, None
+    finally:
+        progress.empty()
+        preview.empty()
+
+
+def generate_filter(df, column, criterion, value, connector="AND"):
     try:
-        match criterion:
-            case "Is null":
-                return df[column].isnull()
-            case "Is not null":
-                return df[column].notnull()
-            case "Greater than" | "Less than" | "Equal to" | "Not equal to" if df[
-                column
-            ].dtype in ["int64", "float64"]:
-                value = float(value)
-                match criterion:
-                    case "Greater than":
-                        return df[column] > value
-                    case "Less than":
-                        return df[column] < value
-                    case "Equal to":
-                        return df[column] == value
-                    case "Not equal to":
-                        return df[column] != value
-            case "Contains" | "Does not contain" | "Starts with" | "Ends with" if df[
-                column
-            ].dtype == "object":
-                match criterion:
-                    case "Contains":
-                        return df[column].str.contains(value, case=False, na=False)
-                    case "Does not contain":
-                        return ~df[column].str.contains(value, case=False, na=False)
-                    case "Starts with":
-                        return df[column].str.startswith(value, na=False)
-                    case "Ends with":
-                        return df[column].str.endswith(value, na=False)
-            case _:
-                st.error(f"Criterion '{criterion}' is not valid for the selected column.")
-                return None
-    except ValueError:
-        st.error(f"The entered value is not valid for the criterion '{criterion}'.")
+        return core.build_spec(df, column, criterion, value, connector)
+    except core.FilterError as e:
+        st.error(str(e))
         return None
+
+
+def filter_mask(df, filters, dataset_id=None):
+    try:
+        # The mask comes from the shared cache, keyed by the specs
+        return core.filter_mask(df, filters, dataset_id)
     except Exception as e:
         st.error(f"Error applying the filter: {e}")
         return None
 
 
-def apply_filters(df, filters, conditions):
-    if not filters:
-        return df
-    combined_filter = filters[0]
-    for i in range(1, len(filters)):
-        match conditions[i - 1]:
-            case "AND":
-                combined_filter &= filters[i]
-            case "OR":
-                combined_filter |= filters[i]
-    return df[combined_filter]
+def render_table(df, key, dataset_id=None, mask=None, page_sizes=(50, 100, 500)):
+    # Only the visible page is sent to the browser; sorting happens here
+    num_rows = len(df) if mask is None else int(mask.sum())
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        sort_column = st.selectbox(
+            "Sort by",
+            [None, *df.columns],
+            format_func=lambda c: "(table order)" if c is None else c,
+            key=f"{key}_sort",
+        )
+    with col2:
+        descending = st.checkbox("Descending", key=f"{key}_desc")
+    with col3:
+        page_size = st.selectbox("Rows per page", page_sizes, key=f"{key}_size")
+    num_pages = max(1, math.ceil(num_rows / page_size))
+    # Keep the page in range when a filter or page size shrinks the view
+    if st.session_state.get(f"{key}_page", 1) > num_pages:
+        st.session_state[f"{key}_page"] = num_pages
+    with col4:
+        page = st.number_input(
+            f"Page (of {num_pages})",
+            min_value=1,
+            max_value=num_pages,
+            step=1,
+            key=f"{key}_page",
+        )
+
+    order = None
+    if sort_column is not None:
+        order = core.sort_order(
+            df[sort_column], dataset_id, sort_column, not descending
+        )
+    positions = core.view_positions(mask, order)
+    page_df = core.page_frame(df, positions, page - 1, page_size)
+    st.dataframe(page_df)
+    first = (page - 1) * page_size
+    st.caption(
+        f"Rows {min(first + 1, num_rows)}–{min(first + page_size, num_rows)} "
+        f"of {num_rows}"
+    )
+    return len(page_df)
+
+
+def export_to_excel(df, sheet_rows=None):
+    # Excel sheets hold at most EXCEL_MAX_ROWS rows, so larger results
+    # continue on FilteredData_2, FilteredData_3...
+    return core.to_excel(df, "FilteredData", core.column_widths(df), sheet_rows)
+
 
+def export_to_excel_file(df, path, rows=None, sheet_rows=None):
+    # Written row by row to disk, so memory stays flat for any result size
+    core.write_xlsx(
+        df, path, "FilteredData", rows, core.column_widths(df), sheet_rows=sheet_rows
+    )
 
-def export_to_excel(dfs, selected_sheet):
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        dfs[selected_sheet].to_excel(writer, index=False, sheet_name="FilteredData")
-        worksheet = writer.sheets["FilteredData"]
-        for i, col in enumerate(dfs[selected_sheet].columns):
-            worksheet.set_column(i, i, max(len(col) + 2, 12))
-    return output.getvalue()
+
+def export_to_excel_parts(df, path, rows=None, part_rows=None):
+    # One workbook per part, written in parallel processes and zipped
+    core.write_xlsx_parts(
+        df, path, part_rows, "FilteredData", rows, core.column_widths(df)
+    )
+
+
+def export_sheets_to_excel(sheets, results, path):
+    # One output sheet per matched input sheet, loaded and written in turn
+    def parts():
+        for result in results:
+            if not result.skipped:
+                df = sheets.load(result.sheet_name)
+                widths = core.column_widths(df)
+                yield result.sheet_name, df, result.mask.nonzero()[0], widths
+
+    core.write_xlsx_sheets(path, parts())
+
+
+def current_session_id():
+    ctx = get_script_run_ctx()
+    return None if ctx is None else ctx.session_id
+
+
+def session_is_live(session_id):
+    # Without a server runtime (bare mode) every session counts as live
+    return not Runtime.exists() or Runtime.instance().is_active_session(session_id)
+
+
+def show_timings(placeholder, recorder):
+    # Filled at the end of the run, or before it stops early; tracing
+    # memory for this run ends here
+    recorder.close()
+    if not recorder.records:
+        return
+    with placeholder.container():
+        with st.expander("Stage timings"):
+            st.caption(
+                f"{len(recorder.records)} stages, "
+                f"{recorder.total_seconds * 1000:.0f} ms in this run"
+            )
+            st.dataframe(recorder.frame(), hide_index=True)
+
+
+def describe_export(num_bytes, seconds=None):
+    size = (
+        f"{num_bytes / 2**20:.1f} MB"
+        if num_bytes >= 2**20
+        else f"{num_bytes / 2**10:.0f} KB"
+    )
+    return size if seconds is None else f"{size} in {seconds:.2f} s"
 
 
 # --- User Interface ---
 st.title("Filter and Save Excel Workbook")
 
 uploaded_file = st.file_uploader("Upload your Excel file", type=["xlsx"])
+session_id = current_session_id()
+
+# Identical uploads share one cached copy; the registry keeps the datasets of
+# live sessions cached and lets the others be evicted first
+datasets = dataset_registry()
+datasets.is_live = session_is_live
+
+# Per-stage timings of this run, shown in the sidebar and logged as JSON
+recorder = StageRecorder(
+    session_id,
+    st.sidebar.checkbox(
+        "Record stage timings",
+        value=settings.INSTRUMENT,
+        help="Wall time, rows and memory of each step of the run",
+    ),
+)
+timings = st.sidebar.empty()
 
 if uploaded_file:
-    sheets = load_excel_file(uploaded_file)
+    with recorder.stage("load_excel_file"):
+        sheets = load_excel_file(uploaded_file)
+    datasets.use(session_id, () if sheets is None else [sheets.digest])
+    # Over the memory ceiling, idle sessions' data goes to the disk cache; it
+    # is memory-mapped back when they rerun
+    governor = memory_governor()
+    governor.enforce(session_id)
     if sheets is not None:
+        cache_stats = workbook_cache().stats()
+        registry_stats = datasets.stats()
+        governor_stats = governor.stats()
+        st.sidebar.caption(
+            f"Workbook cache: {cache_stats['hits']} hits, "
+            f"{cache_stats['misses']} misses, "
+            f"{cache_stats['bytes'] / 2**20:.0f} of "
+            f"{cache_stats['max_bytes'] / 2**20:.0f} MB used; "
+            f"{registry_stats['datasets']} workbooks open in "
+            f"{registry_stats['sessions']} sessions, this one shared by "
+            f"{datasets.refcount(sheets.digest)}"
+        )
+        if governor.enabled:
+            st.sidebar.caption(
+                f"Session data: {governor_stats['bytes'] / 2**20:.0f} of "
+                f"{governor_stats['max_bytes'] / 2**20:.0f} MB; "
+                f"{governor_stats['spills']} idle workbooks spilled to disk"
+            )
+
+        optimize_memory = st.sidebar.checkbox(
+            "Optimize memory usage",
+            help="Downcast numbers and store text as Arrow strings or categories",
+        )
+
         # Let the user select the sheet
         sheet_names = list(sheets.keys())
         selected_sheet = st.selectbox("Select a sheet to work with", sheet_names)
 
-        # Load the selected sheet
-        df = sheets[selected_sheet]
-
-        # Display the original table with record count
+        # Load the selected sheet and display it with record count
         st.subheader("Full Table")
-        st.write(f"Number of records: {len(df)}")
-        st.dataframe(df)
+        with recorder.stage("load_sheet", selected_sheet) as stage:
+            df, memory = load_sheet(sheets, selected_sheet, optimize_memory)
+            stage.rows_out = None if df is None else len(df)
+        if df is None:
+            show_timings(timings, recorder)
+            st.stop()
+        dataset_id = sheets.sheet_key(selected_sheet)
+        # Text search indexes are built in the background and shared
+        core.build_text_indexes(df, dataset_id)
+
+        records_col, memory_col = st.columns(2)
+        records_col.write(f"Number of records: {len(df)}")
+        # Same values, so masks and indexes stay keyed by dataset_id; exports
+        # carry the optimised dtypes, so they are cached apart
+        export_id = dataset_id if memory is None else ("optimized", dataset_id)
+        if memory is not None:
+            memory_col.write(
+                f"Memory: {memory['before'] / 2**20:.2f} MB → "
+                f"{memory['after'] / 2**20:.2f} MB"
+            )
+        with recorder.stage("render", "full", len(df)) as stage:
+            stage.rows_out = render_table(df, "full", dataset_id)
 
         # Initialize filter states if not already present
+        # Only the filter specs live in the session, never the row masks
         if "filters" not in st.session_state:
             st.session_state.filters = []
-            st.session_state.conditions = []
             st.session_state.num_filters = 1
 
         # Button to reset filters
         if st.button("Reset Filters"):
             st.session_state.filters = []
-            st.session_state.conditions = []
             st.session_state.num_filters = 1
             st.session_state.apply_filters = True
             st.rerun()
@@ -122,6 +287,8 @@ if uploaded_file:
                 value=st.session_state.num_filters,
             )
 
+            filters = []
+            connector = "AND"
             for i in range(st.session_state.num_filters):
                 st.write(f"Filter {i + 1}")
                 col1, col2, col3, col4 = st.columns(4)
@@ -130,25 +297,7 @@ if uploaded_file:
                     column = st.selectbox(f"Column", df.columns, key=f"col_{i}")
 
                 with col2:
-                    filter_criteria = (
-                        [
-                            "Greater than",
-                            "Less than",
-                            "Equal to",
-                            "Not equal to",
-                            "Is null",
-                            "Is not null",
-                        ]
-                        if df[column].dtype in ["int64", "float64"]
-                        else [
-                            "Contains",
-                            "Does not contain",
-                            "Starts with",
-                            "Ends with",
-                            "Is null",
-                            "Is not null",
-                        ]
-                    )
+                    filter_criteria = core.criteria_for(df[column])
                     criterion = st.selectbox(
                         f"Criterion", filter_criteria, key=f"crit_{i}"
                     )
@@ -166,25 +315,20 @@ if uploaded_file:
                         else None
                     )
 
-                filter_obj = generate_filter(df, column, criterion, value)
-                if filter_obj is not None:
-                    if i < len(st.session_state.filters):
-                        st.session_state.filters[i] = filter_obj
-                    else:
-                        st.session_state.filters.append(filter_obj)
+                with recorder.stage(
+                    "generate_filter", f"{column} {criterion}", len(df)
+                ):
+                    filters.append(
+                        generate_filter(df, column, criterion, value, connector)
+                    )
 
                 with col4:
+                    # The condition joins this filter to the next one
                     if i < st.session_state.num_filters - 1:
-                        if i < len(st.session_state.conditions):
-                            st.session_state.conditions[i] = st.radio(
-                                "Condition", ["AND", "OR"], key=f"cond_radio_{i}"
-                            )
-                        else:
-                            st.session_state.conditions.append(
-                                st.radio(
-                                    "Condition", ["AND", "OR"], key=f"cond_radio_{i}"
-                                )
-                            )
+                        connector = st.radio(
+                            "Condition", ["AND", "OR"], key=f"cond_radio_{i}"
+                        )
+            st.session_state.filters = filters
 
         # Automatically apply filters
         if "apply_filters" not in st.session_state:
@@ -194,26 +338,192 @@ if uploaded_file:
             len(st.session_state.filters) > 0
             and any(f is not None for f in st.session_state.filters)
         ):
-            filtered_df = apply_filters(
-                df, st.session_state.filters, st.session_state.conditions
-            )
+            with recorder.stage("apply_filters", rows_in=len(df)) as stage:
+                mask = filter_mask(df, st.session_state.filters, dataset_id)
+                num_result_rows = len(df) if mask is None else int(mask.sum())
+                stage.rows_out = num_result_rows
             st.subheader("Filtered Table")
-            st.write(f"Number of records: {len(filtered_df)}")
-            st.dataframe(filtered_df)
+            st.write(f"Number of records: {num_result_rows}")
+            with recorder.stage("render", "filtered", num_result_rows) as stage:
+                stage.rows_out = render_table(df, "filtered", dataset_id, mask)
 
             # Export filtered table
             output_file_name = st.text_input(
                 "Enter the output file name (without extension)",
                 "filtered_table",
             )
-            filtered_df_to_excel = export_to_excel(sheets, selected_sheet)
+            # Files are only written on request, once per filtered result
+            specs = [spec for spec in st.session_state.filters if spec is not None]
+            with st.expander("Excel export options"):
+                part_rows = st.number_input(
+                    "Rows per sheet or workbook",
+                    min_value=1,
+                    max_value=core.EXCEL_MAX_ROWS - 1,
+                    value=min(settings.EXPORT_PART_ROWS, core.EXCEL_MAX_ROWS - 1),
+                    step=10_000,
+                )
+                to_disk = core.export_files().enabled and st.checkbox(
+                    "Constant-memory export (through a temporary file)"
+                )
+                split_files = core.export_files().enabled and st.checkbox(
+                    "Split into separate workbooks (zip)"
+                )
+            # Results over the part size are split into sheets or workbooks
+            sheet_rows = part_rows if num_result_rows > part_rows else None
+            split_files = split_files and sheet_rows is not None
 
-            st.download_button(
-                label="Download filtered table as Excel",
-                data=filtered_df_to_excel,
-                file_name=f"{output_file_name}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            )
+            if split_files or to_disk:
+                suffix = ".zip" if split_files else ".xlsx"
+                excel_key = core.export_key(export_id, specs, (suffix, sheet_rows))
+                excel_path = core.prepared_export_file(excel_key, suffix)
+                if excel_path is None and st.button("Prepare Excel file"):
+                    rows = None if mask is None else mask.nonzero()[0]
+                    write = (
+                        export_to_excel_parts if split_files else export_to_excel_file
+                    )
+                    with st.spinner("Writing the Excel file..."), recorder.stage(
+                        "export_to_excel", suffix, num_result_rows
+                    ):
+                        excel_path = core.prepare_export_file(
+                            excel_key,
+                            lambda path: write(df, path, rows, sheet_rows),
+                            suffix,
+                        )
+                filtered_df_to_excel = excel_details = None
+                if excel_path is not None:
+                    excel_details = describe_export(Path(excel_path).stat().st_size)
+                    # download_button keeps the bytes it serves in memory, so
+                    # the file is only read on request, not on every rerun
+                    if st.button("Load Excel file for download"):
+                        filtered_df_to_excel = Path(excel_path).read_bytes()
+                    else:
+                        st.caption(excel_details)
+            else:
+                suffix = ".xlsx"
+                excel_key = core.export_key(export_id, specs, (suffix, sheet_rows))
+                prepared = core.prepared_export(excel_key)
+                if prepared is None and st.button("Prepare Excel file"):
+                    with st.spinner("Writing the Excel file..."), recorder.stage(
+                        "export_to_excel", suffix, num_result_rows
+                    ):
+                        prepared = core.prepare_export(
+                            excel_key,
+                            lambda: export_to_excel(
+                                df if mask is None else df[mask], sheet_rows
+                            ),
+                        )
+                filtered_df_to_excel = None if prepared is None else prepared.data
+                excel_details = (
+                    None
+                    if prepared is None
+                    else describe_export(prepared.nbytes, prepared.seconds)
+                )
+
+            if filtered_df_to_excel is not None:
+                st.download_button(
+                    label="Download filtered table as Excel",
+                    data=filtered_df_to_excel,
+                    file_name=f"{output_file_name}{suffix}",
+                    mime=(
+                        "application/zip"
+                        if split_files
+                        else "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                    ),
+                )
+                st.caption(excel_details)
+
+            # Columnar formats are written straight from Arrow, much faster
+            st.write("Other formats")
+            format_keys = {
+                file_format: core.export_key(export_id, specs, file_format)
+                for file_format in core.EXPORT_FORMATS
+            }
+            prepared_formats = {
+                file_format: core.prepared_export(key)
+                for file_format, key in format_keys.items()
+            }
+            if None in prepared_formats.values() and st.button(
+                "Prepare CSV, Parquet and Arrow files"
+            ):
+                filtered_df = df if mask is None else df[mask]
+                with st.spinner("Writing the files..."):
+                    for file_format, key in format_keys.items():
+                        with recorder.stage("export", file_format, len(filtered_df)):
+                            prepared_formats[file_format] = core.prepare_export(
+                                key,
+                                partial(core.export_bytes, filtered_df, file_format),
+                            )
+            format_columns = st.columns(len(core.EXPORT_FORMATS))
+            for format_column, (file_format, (label, extension, mime)) in zip(
+                format_columns, core.EXPORT_FORMATS.items()
+            ):
+                prepared = prepared_formats[file_format]
+                if prepared is not None:
+                    with format_column:
+                        st.download_button(
+                            label=f"Download {label}",
+                            data=prepared.data,
+                            file_name=f"{output_file_name}{extension}",
+                            mime=mime,
+                            key=f"download_{file_format}",
+                        )
+                        st.caption(describe_export(prepared.nbytes, prepared.seconds))
+
+            # Batch mode: the same filters on every sheet that has the columns
+            if (
+                specs
+                and len(sheets) > 1
+                and st.checkbox("Apply the filters to every sheet")
+            ):
+                with st.spinner("Filtering every sheet..."), recorder.stage(
+                    "filter_sheets", f"{len(sheets)} sheets"
+                ) as stage:
+                    results = core.filter_sheets(sheets, specs)
+                    stage.rows_out = sum(r.matches or 0 for r in results)
+                st.dataframe(
+                    pd.DataFrame(
+                        {
+                            "Sheet": [r.sheet_name for r in results],
+                            "Records": pd.array(
+                                [r.num_rows for r in results], dtype="Int64"
+                            ),
+                            "Matches": pd.array(
+                                [r.matches for r in results], dtype="Int64"
+                            ),
+                            "Note": [r.reason or "" for r in results],
+                        }
+                    ),
+                    hide_index=True,
+                )
+                batch_key = core.export_key(("workbook", sheets.digest), specs, "xlsx")
+                prepared = core.prepared_export(batch_key)
+                if (
+                    prepared is None
+                    and any(not r.skipped for r in results)
+                    and st.button("Prepare workbook with every sheet")
+                ):
+                    with st.spinner("Writing the Excel file..."), recorder.stage(
+                        "export_to_excel", "every sheet"
+                    ):
+                        prepared = core.prepare_export(
+                            batch_key,
+                            lambda: core.file_bytes(
+                                partial(export_sheets_to_excel, sheets, results)
+                            ),
+                        )
+                if prepared is not None:
+                    st.download_button(
+                        label="Download every filtered sheet as Excel",
+                        data=prepared.data,
+                        file_name=f"{output_file_name}_all_sheets.xlsx",
+                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                        key="download_all_sheets",
+                    )
+                    st.caption(describe_export(prepared.nbytes, prepared.seconds))
 
         # Reset apply_filters state
         st.session_state.apply_filters = False
+else:
+    datasets.use(session_id, ())
+
+show_timings(timings, recorder)
@@ -0,0 +1,6 @@
+"""
+Benchmarks of the load, filter and export stages on synthetic workbooks.
+
+    python -m benchmarks.run --rows 10000 100000 -o after.json
+    python -m benchmarks.compare before.json after.json
+"""
@@ -0,0 +1,126 @@
+"""Compare two benchmark result files and flag the stages that regressed."""
+
+import argparse
+import json
+import sys
+
+# Changes smaller than these are noise whatever their ratio.
+MIN_SECONDS = 0.005
+MIN_BYTES = 1024 * 1024
+
+
+def load_results(path):
+    with open(path, encoding="utf-8") as source:
+        return json.load(source)
+
+
+def _key(result):
+    return json.dumps(result["workbook"], sort_keys=True), result["stage"]
+
+
+def _workbook_label(workbook):
+    if "path" in workbook:
+        return workbook["path"]
+    return (
+        f"{workbook['rows']}x{workbook['columns']}, {workbook['sheets']} sheets, "
+        f"cardinality {workbook['cardinality']}"
+    )
+
+
+def compare(baseline, current, threshold=0.2):
+    """
+    Match the results of two runs by workbook and stage.
+    Args:
+        baseline: results document of the reference run.
+        current: results document of the run to check.
+        threshold: relative change, e.g. 0.2, above which a stage counts as
+            slower (or faster) or as using more (or less) memory.
+    Returns:
+        list of dicts with workbook, stage, metric ("seconds" compares the
+        fastest run, "peak_bytes" the traced peak), before, after, change
+        (after / before - 1) and status: "regression", "improvement" or "same".
+    """
+    before = {_key(result): result for result in baseline["results"]}
+    changes = []
+    for result in current["results"]:
+        reference = before.get(_key(result))
+        if reference is None:
+            continue
+        for metric, old, new, noise in (
+            (
+                "seconds",
+                reference["seconds"]["min"],
+                result["seconds"]["min"],
+                MIN_SECONDS,
+            ),
+            ("peak_bytes", reference["peak_bytes"], result["peak_bytes"], MIN_BYTES),
+        ):
+            change = new / old - 1 if old else 0.0
+            status = "same"
+            if abs(new - old) >= noise and abs(change) > threshold:
+                status = "regression" if change > 0 else "improvement"
+            changes.append(
+                {
+                    "workbook": _workbook_label(result["workbook"]),
+                    "stage": result["stage"],
+                    "metric": metric,
+                    "before": old,
+                    "after": new,
+                    "change": change,
+                    "status": status,
+                }
+            )
+    return changes
+
+
+def _format(metric, value):
+    if metric == "seconds":
+        return f"{value:.3f} s"
+    return f"{value / 2**20:.1f} MB"
+
+
+def print_report(changes, file=sys.stdout):
+    """Print the regressions and improvements, then a one-line summary."""
+    for change in changes:
+        if change["status"] == "same":
+            continue
+        print(
+            f"{change['status'].upper():<11} {change['workbook']} {change['stage']} "
+            f"{change['metric']}: {_format(change['metric'], change['before'])} -> "
+            f"{_format(change['metric'], change['after'])} ({change['change']:+.0%})",
+            file=file,
+        )
+    counts = {
+        status: sum(change["status"] == status for change in changes)
+        for status in ("regression", "improvement", "same")
+    }
+    print(
+        f"{counts['regression']} regressions, {counts['improvement']} improvements, "
+        f"{counts['same']} unchanged",
+        file=file,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.compare",
+        description="Flag the stages of a benchmark run that regressed.",
+    )
+    parser.add_argument("baseline", help="results of the reference run")
+    parser.add_argument("current", help="results of the run to check")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="relative change that counts (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+    changes = compare(
+        load_results(args.baseline), load_results(args.current), args.threshold
+    )
+    print_report(changes)
+    return 1 if any(change["status"] == "regression" for change in changes) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,360 @@
+"""
+Time each stage of the filter workflow on synthetic (or given) workbooks and
+write the results to JSON.
+
+Every stage starts cold: the workbook, mask and index caches are cleared
+before each run, so a result is what a user pays the first time. Peak memory
+is measured by tracemalloc on one extra run; it covers pandas and NumPy
+buffers but not Arrow's, which allocates outside the Python allocator.
+"""
+
+import os
+
+# Sheets are parsed from the workbook on every run rather than memory-mapped
+# from files spilled by an earlier one. Set EXCELFILTER_DISK_CACHE_MB to
+# measure the disk cache instead.
+os.environ.setdefault("EXCELFILTER_DISK_CACHE_MB", "0")
+
+import argparse
+import datetime
+import fnmatch
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from importlib import metadata
+from io import BytesIO
+
+from excelfilter import core
+from excelfilter.batch import filter_sheets
+from excelfilter.cache import workbook_cache
+from excelfilter.dtypes import is_numeric_column, is_text_column
+from excelfilter.export import EXPORT_FORMATS, export_bytes, write_xlsx
+from excelfilter.filters import NULL_CRITERIA, mask_cache
+from excelfilter.workbook import LazyWorkbook
+
+from .compare import compare, load_results, print_report
+from .workbooks import (
+    DEFAULT_DATA_DIR,
+    add_shape_arguments,
+    shape_from_arguments,
+    workbook_path,
+)
+
+PACKAGES = ("pandas", "numpy", "pyarrow", "openpyxl", "XlsxWriter")
+
+
+def clear_caches():
+    workbook_cache().clear()
+    mask_cache().clear()
+
+
+def measure(run, repeat=3, setup=clear_caches):
+    """
+    Time run() repeat times, calling setup() untimed before each, then trace
+    one more run for its peak memory.
+    Returns:
+        (last result of run, list of seconds, peak traced bytes)
+    """
+    seconds = []
+    for _ in range(repeat):
+        setup()
+        started = time.perf_counter()
+        result = run()
+        seconds.append(time.perf_counter() - started)
+    setup()
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+def _text_sample(series):
+    values = series.dropna()
+    return str(values.iloc[0]) if len(values) else "a"
+
+
+def filter_cases(df):
+    """
+    One spec per criterion: comparisons and null checks on the first numeric
+    column, text matches on the first plain and first dictionary-encoded text
+    columns. Values come from the data, so every case selects some rows.
+    Returns:
+        list of (stage name, FilterSpec).
+    """
+    cases = []
+    numeric = next((c for c in df.columns if is_numeric_column(df[c])), None)
+    if numeric is not None:
+        values = df[numeric].dropna()
+        median = float(values.median()) if len(values) else 0.0
+        first = float(values.iloc[0]) if len(values) else 0.0
+        for criterion, value in (
+            ("Greater than", median),
+            ("Less than", median),
+            ("Equal to", first),
+            ("Not equal to", first),
+            *((criterion, None) for criterion in NULL_CRITERIA),
+        ):
+            cases.append((numeric, criterion, value))
+    text_columns = [c for c in df.columns if is_text_column(df[c])]
+    plain = next((c for c in text_columns if df[c].dtype != "category"), None)
+    encoded = next((c for c in text_columns if df[c].dtype == "category"), None)
+    for column in (plain, encoded):
+        if column is None:
+            continue
+        sample = _text_sample(df[column])
+        middle = len(sample) // 2
+        for criterion, value in (
+            ("Contains", sample[middle : middle + 3]),
+            ("Does not contain", sample[middle : middle + 3]),
+            ("Starts with", sample[:6]),
+            ("Ends with", sample[-3:]),
+        ):
+            cases.append((column, criterion, value))
+    return [
+        (
+            f"generate_filter:{criterion}:{column}",
+            core.build_spec(df, column, criterion, value),
+        )
+        for column, criterion, value in cases
+    ]
+
+
+def filter_chain(cases, connector):
+    """The first case of each column, joined by connector."""
+    specs = {}
+    for _, spec in cases:
+        if spec.criterion not in NULL_CRITERIA:
+            specs.setdefault(spec.column, spec)
+    specs = list(specs.values())
+    return core.connect(specs, [connector] * (len(specs) - 1))
+
+
+def benchmark_workbook(data, repeat=3, include=None, report=None):
+    """
+    Run every stage on the first sheet of a workbook (and filter_sheets on
+    all of them when there are several).
+    Args:
+        data: bytes of the .xlsx file.
+        repeat: timed runs per stage.
+        include: optional glob patterns of the stages to run.
+        report: optional callback(result) after each stage.
+    Returns:
+        list of result dicts without the workbook description.
+    """
+    results = []
+
+    def stage(name, run, rows_in, rows_out=len):
+        if include and not any(fnmatch.fnmatch(name, p) for p in include):
+            return None
+        value, seconds, peak = measure(run, repeat)
+        result = {
+            "stage": name,
+            "rows_in": rows_in,
+            "rows_out": rows_out(value) if rows_out else None,
+            "seconds": {
+                "min": min(seconds),
+                "median": statistics.median(seconds),
+                "runs": seconds,
+            },
+            "peak_bytes": peak,
+        }
+        results.append(result)
+        if report is not None:
+            report(result)
+        return value
+
+    book = LazyWorkbook(data)
+    first = book.sheet_names[0]
+    clear_caches()
+    df = book.load(first)
+    dataset_id = book.sheet_key(first)
+    rows = len(df)
+
+    stage("read_excel", lambda: core.load_excel(BytesIO(data))[0], rows)
+    stage("load_sheet", lambda: LazyWorkbook(data).load(first), rows)
+
+    cases = filter_cases(df)
+    for name, spec in cases:
+        stage(
+            name,
+            lambda spec=spec: core.filter_mask(df, [spec], dataset_id),
+            rows,
+            lambda mask: int(mask.sum()),
+        )
+    for connector in ("AND", "OR"):
+        specs = filter_chain(cases, connector)
+        stage(
+            f"apply_filters:{connector}x{len(specs)}",
+            lambda specs=specs: core.apply_filters(df, specs, dataset_id),
+            rows,
+        )
+    if len(book) > 1:
+        specs = filter_chain(cases, "AND")
+        stage(
+            f"filter_sheets:{len(book)}",
+            lambda: filter_sheets(LazyWorkbook(data), specs),
+            None,
+            lambda sheets: sum(result.matches or 0 for result in sheets),
+        )
+
+    widths = core.column_widths(df)
+    stage(
+        "export_to_excel",
+        lambda: core.to_excel(df, "FilteredData", widths),
+        rows,
+        None,
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "export.xlsx")
+        stage(
+            "export_to_excel_file",
+            lambda: write_xlsx(df, path, "FilteredData", column_widths=widths),
+            rows,
+            None,
+        )
+    for file_format in EXPORT_FORMATS:
+        stage(
+            f"export:{file_format}",
+            lambda file_format=file_format: export_bytes(df, file_format),
+            rows,
+            None,
+        )
+
+    return results
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _versions():
+    versions = {}
+    for package in PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.run",
+        description=(
+            "Time load, filter and export on synthetic workbooks and write "
+            "the results to JSON."
+        ),
+    )
+    parser.add_argument(
+        "--rows",
+        type=int,
+        nargs="+",
+        default=[10_000, 100_000],
+        help="data rows per sheet, one workbook per value (%(default)s)",
+    )
+    parser.add_argument(
+        "--cardinality",
+        type=int,
+        nargs="+",
+        default=[100],
+        help="distinct values per category column, one workbook per value",
+    )
+    add_shape_arguments(parser)
+    parser.add_argument(
+        "--workbook",
+        nargs="+",
+        help="benchmark these .xlsx files instead of synthetic ones",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="(%(default)s)")
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        metavar="PATTERN",
+        help="only run the stages matching these globs, e.g. 'generate_filter:*'",
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=DEFAULT_DATA_DIR,
+        help="where generated workbooks are kept (%(default)s)",
+    )
+    parser.add_argument("-o", "--output", default="benchmark.json")
+    parser.add_argument(
+        "--baseline", help="earlier results to compare against; exit 1 on regressions"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="relative change flagged against the baseline (%(default)s)",
+    )
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.workbook:
+        workbooks = [({"path": path}, path) for path in args.workbook]
+    else:
+        shapes = [
+            shape_from_arguments(args, rows, cardinality)
+            for rows in args.rows
+            for cardinality in args.cardinality
+        ]
+        workbooks = [
+            (shape.to_dict(), workbook_path(shape, args.data_dir)) for shape in shapes
+        ]
+
+    document = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "versions": _versions(),
+        "repeat": args.repeat,
+        "results": [],
+    }
+    for workbook, path in workbooks:
+        label = os.path.basename(path)
+
+        def report(result):
+            print(
+                f"{label} {result['stage']}: {result['seconds']['min']:.3f} s, "
+                f"peak {result['peak_bytes'] / 2**20:.1f} MB",
+                file=sys.stderr,
+            )
+
+        with open(path, "rb") as source:
+            data = source.read()
+        for result in benchmark_workbook(data, args.repeat, args.stages, report):
+            document["results"].append({"workbook": workbook, **result})
+
+    with open(args.output, "w", encoding="utf-8") as sink:
+        json.dump(document, sink, indent=2)
+    if args.baseline:
+        changes = compare(load_results(args.baseline), document, args.threshold)
+        print_report(changes, file=sys.stderr)
+        if any(change["status"] == "regression" for change in changes):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
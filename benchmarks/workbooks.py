@@ -0,0 +1,193 @@
+"""Synthetic xlsx workbooks of a given shape, generated once and reused."""
+
+import argparse
+import os
+import tempfile
+from dataclasses import asdict, dataclass
+
+import numpy as np
+import pandas as pd
+
+from excelfilter.export import write_xlsx_sheets
+
+COLUMN_KINDS = ("int", "float", "text", "category", "date")
+
+# Words the text columns are built from; filters search for them.
+WORDS = (
+    "alpha",
+    "bravo",
+    "charlie",
+    "delta",
+    "echo",
+    "foxtrot",
+    "golf",
+    "hotel",
+    "india",
+    "juliett",
+    "kilo",
+    "lima",
+    "mike",
+    "november",
+    "oscar",
+    "papa",
+)
+
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), "excelfilter-benchmarks")
+
+
+@dataclass(frozen=True)
+class WorkbookShape:
+    """
+    Layout of a synthetic workbook.
+    Attributes:
+        rows: data rows per sheet.
+        columns: columns per sheet, their kinds cycling through mix.
+        sheets: number of worksheets, all of the same shape.
+        mix: column kinds, from COLUMN_KINDS.
+        cardinality: distinct values of each category column; text columns
+            are close to unique.
+        null_fraction: share of empty cells in every column.
+        seed: random seed, so a shape always produces the same cells.
+    """
+
+    rows: int
+    columns: int = 10
+    sheets: int = 1
+    mix: tuple = COLUMN_KINDS
+    cardinality: int = 100
+    null_fraction: float = 0.05
+    seed: int = 0
+
+    def __post_init__(self):
+        unknown = set(self.mix) - set(COLUMN_KINDS)
+        if unknown or not self.mix:
+            raise ValueError(f"Unknown column kinds: {sorted(unknown)}")
+
+    @property
+    def name(self):
+        return (
+            f"r{self.rows}-c{self.columns}-s{self.sheets}-{'.'.join(self.mix)}"
+            f"-k{self.cardinality}-n{self.null_fraction:g}-seed{self.seed}"
+        )
+
+    def to_dict(self):
+        data = asdict(self)
+        data["mix"] = list(self.mix)
+        return data
+
+
+def _column(kind, rows, cardinality, rng):
+    match kind:
+        case "int":
+            return pd.Series(rng.integers(0, 1_000_000, rows))
+        case "float":
+            return pd.Series(rng.normal(1000.0, 250.0, rows).round(2))
+        case "text":
+            words = np.asarray(WORDS, dtype=object)[rng.integers(0, len(WORDS), rows)]
+            numbers = pd.Series(rng.integers(0, 10**8, rows)).map("{:08d}".format)
+            return "ref-" + numbers + " " + pd.Series(words)
+        case "category":
+            labels = np.array([f"label-{k:05d}" for k in range(cardinality)], object)
+            return pd.Series(labels[rng.integers(0, cardinality, rows)])
+        case "date":
+            days = rng.integers(0, 3650, rows)
+            return pd.Series(
+                pd.Timestamp("2015-01-01") + pd.to_timedelta(days, unit="D")
+            )
+
+
+def synthetic_frame(shape, sheet=0):
+    """
+    Cells of one sheet of shape, as pd.read_excel would return them.
+    Args:
+        shape: WorkbookShape.
+        sheet: sheet number; each sheet gets its own values.
+    Returns:
+        DataFrame with columns named "<kind>_<number>".
+    """
+    rng = np.random.default_rng([shape.seed, sheet])
+    columns = {}
+    for number in range(shape.columns):
+        kind = shape.mix[number % len(shape.mix)]
+        series = _column(kind, shape.rows, shape.cardinality, rng)
+        if shape.null_fraction:
+            series = series.mask(rng.random(shape.rows) < shape.null_fraction)
+        columns[f"{kind}_{number}"] = series
+    return pd.DataFrame(columns)
+
+
+def sheet_names(shape):
+    return [f"Sheet{number + 1}" for number in range(shape.sheets)]
+
+
+def write_workbook(shape, path):
+    """Write the sheets of shape to an xlsx file, one sheet in memory at a time."""
+    write_xlsx_sheets(
+        path,
+        (
+            (name, synthetic_frame(shape, number), None, None)
+            for number, name in enumerate(sheet_names(shape))
+        ),
+    )
+
+
+def workbook_path(shape, directory=DEFAULT_DATA_DIR):
+    """Path of the workbook for shape in directory, generating it if missing."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{shape.name}.xlsx")
+    if not os.path.exists(path):
+        # Written under a temporary name so an interrupted run leaves nothing.
+        temporary = f"{path}.{os.getpid()}.tmp"
+        write_workbook(shape, temporary)
+        os.replace(temporary, path)
+    return path
+
+
+def add_shape_arguments(parser):
+    parser.add_argument(
+        "--columns", type=int, default=10, help="columns per sheet (%(default)s)"
+    )
+    parser.add_argument("--sheets", type=int, default=1, help="(%(default)s)")
+    parser.add_argument(
+        "--mix",
+        default=",".join(COLUMN_KINDS),
+        help="comma-separated column kinds, cycled over the columns (%(default)s)",
+    )
+    parser.add_argument(
+        "--null-fraction", type=float, default=0.05, help="(%(default)s)"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="(%(default)s)")
+
+
+def shape_from_arguments(args, rows, cardinality):
+    return WorkbookShape(
+        rows,
+        args.columns,
+        args.sheets,
+        tuple(kind.strip() for kind in args.mix.split(",") if kind.strip()),
+        cardinality,
+        args.null_fraction,
+        args.seed,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.workbooks",
+        description="Generate a synthetic xlsx workbook.",
+    )
+    parser.add_argument("output", help=".xlsx file to write")
+    parser.add_argument("--rows", type=int, default=10_000, help="(%(default)s)")
+    parser.add_argument(
+        "--cardinality",
+        type=int,
+        default=100,
+        help="distinct values per category column (%(default)s)",
+    )
+    add_shape_arguments(parser)
+    args = parser.parse_args(argv)
+    write_workbook(shape_from_arguments(args, args.rows, args.cardinality), args.output)
+
+
+if __name__ == "__main__":
+    main()
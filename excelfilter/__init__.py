@@ -0,0 +1 @@
+"""Shared loading, caching and filtering helpers for the Excel filter apps."""
@@ -0,0 +1,76 @@
+"""One filter set applied to every sheet of a workbook."""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+
+from .filters import FilterError, FilterPlan, validate_spec
+
+
+@dataclass(frozen=True)
+class SheetResult:
+    """
+    Outcome of a filter set on one sheet.
+    Attributes:
+        sheet_name: the sheet.
+        num_rows: rows in the sheet, or None if it could not be read.
+        mask: boolean row mask of the matches, or None if skipped.
+        reason: why the sheet was skipped, else None.
+    """
+
+    sheet_name: str
+    num_rows: object = None
+    mask: object = None
+    reason: str = None
+
+    @property
+    def skipped(self):
+        return self.mask is None
+
+    @property
+    def matches(self):
+        return None if self.mask is None else int(np.count_nonzero(self.mask))
+
+
+def filter_sheet(sheets, sheet_name, specs):
+    """
+    Evaluate specs on one sheet of a LazyWorkbook.
+    Returns:
+        SheetResult, skipped when a spec does not fit the sheet's columns.
+    """
+    if sheet_name not in sheets.sheet_names:
+        return SheetResult(sheet_name, reason=f"Sheet '{sheet_name}' does not exist.")
+    try:
+        df = sheets.load(sheet_name)
+    except Exception as e:
+        return SheetResult(sheet_name, reason=f"Could not be read: {e}")
+    try:
+        specs = [validate_spec(df, spec) for spec in specs]
+    except FilterError as e:
+        return SheetResult(sheet_name, len(df), reason=str(e))
+    mask = FilterPlan(specs).evaluate(df, sheets.sheet_key(sheet_name))
+    return SheetResult(sheet_name, len(df), mask)
+
+
+def filter_sheets(sheets, specs, max_workers=None):
+    """
+    Evaluate one filter set on every sheet of a workbook in parallel.
+    Sheets not cached yet are parsed by worker processes first; the plans
+    then run on threads against the shared mask cache and indexes.
+    Args:
+        sheets: LazyWorkbook.
+        specs: FilterSpecs, validated again against each sheet.
+        max_workers: parallelism; defaults to one per CPU.
+    Returns:
+        list of SheetResult in workbook order.
+    """
+    sheets.preload(max_workers=max_workers)
+    max_workers = min(len(sheets) or 1, max_workers or os.cpu_count() or 1)
+    with ThreadPoolExecutor(
+        max_workers, thread_name_prefix="excelfilter-batch"
+    ) as pool:
+        return list(
+            pool.map(lambda name: filter_sheet(sheets, name, specs), sheets.sheet_names)
+        )
@@ -0,0 +1,183 @@
+"""Content-hash keyed, memory-bounded caches shared by every session."""
+
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from io import BytesIO
+
+import pandas as pd
+
+from . import settings
+from .registry import dataset_registry
+
+
+def content_hash(data):
+    """Digest identifying a workbook by its raw bytes."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+_upload_digests = OrderedDict()
+_upload_digests_lock = threading.Lock()
+
+
+def upload_digest(uploaded_file):
+    """
+    content_hash of an upload, remembered per Streamlit file_id so reruns do
+    not hash the same bytes again.
+    """
+    file_id = getattr(uploaded_file, "file_id", None)
+    with _upload_digests_lock:
+        digest = _upload_digests.get(file_id) if file_id else None
+    if digest is None:
+        digest = content_hash(uploaded_file.getvalue())
+        if file_id:
+            with _upload_digests_lock:
+                _upload_digests[file_id] = digest
+                while len(_upload_digests) > 1024:
+                    _upload_digests.popitem(last=False)
+    return digest
+
+
+def estimate_size(obj):
+    """Approximate number of bytes held by a cached value."""
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(obj, pd.DataFrame) else int(usage)
+    if isinstance(obj, dict):
+        return sum(estimate_size(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(estimate_size(value) for value in obj)
+    if hasattr(obj, "nbytes"):
+        return int(obj.nbytes)
+    return sys.getsizeof(obj)
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache that evicts by total size instead of entry count.
+
+    With an in_use predicate, entries it accepts (those of datasets a session
+    holds) are evicted only once no other entry is left to evict.
+    """
+
+    def __init__(self, max_bytes, in_use=None):
+        self.max_bytes = max_bytes
+        self.in_use = in_use
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.current_bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key):
+        """Like get, without counting a hit or miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        size = estimate_size(value) if size is None else size
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                # Too large to keep; the caller still gets the value it loaded.
+                return value
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted_size = self._entries.pop(self._victim(key))
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+        return value
+
+    def _victim(self, keep):
+        # Least recently used first, sparing the entry just stored and the
+        # entries of datasets in use for as long as anything else is left.
+        fallback = None
+        for key in self._entries:
+            if key == keep:
+                continue
+            if self.in_use is None or not self.in_use(key):
+                return key
+            if fallback is None:
+                fallback = key
+        return keep if fallback is None else fallback
+
+    def pop(self, key):
+        """Remove an entry without counting an eviction; return its value."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self.current_bytes -= entry[1]
+            return entry[0]
+
+    def entries(self):
+        """Snapshot of (key, value, size), least recently used first."""
+        with self._lock:
+            return [(key, value, size) for key, (value, size) in self._entries.items()]
+
+    def get_or_load(self, key, loader):
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, loader())
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+@lru_cache(maxsize=None)
+def workbook_cache():
+    """Process-wide cache shared by every Streamlit session and rerun."""
+    return LRUCache(settings.WORKBOOK_CACHE_MB * 1024 * 1024, dataset_registry().in_use)
+
+
+def read_excel_key(uploaded_file, **options):
+    """Cache key (and dataset id) of read_excel_cached for these arguments."""
+    return ("read_excel", upload_digest(uploaded_file), tuple(sorted(options.items())))
+
+
+def read_excel_cached(uploaded_file, **options):
+    """
+    Parse an uploaded workbook once per distinct content and reader options.
+    Args:
+        uploaded_file: file-like object with the .xlsx bytes.
+        options: keyword arguments forwarded to pd.read_excel.
+    Returns:
+        Whatever pd.read_excel returns for those options.
+    """
+    return workbook_cache().get_or_load(
+        read_excel_key(uploaded_file, **options),
+        lambda: pd.read_excel(BytesIO(uploaded_file.getvalue()), **options),
+    )
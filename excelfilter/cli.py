@@ -0,0 +1,266 @@
+"""Command-line batch runner: one saved filter set over many workbooks."""
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .batch import filter_sheet
+from .export import EXPORT_FORMATS, export_bytes, write_xlsx_sheets
+from .filters import FilterSpec
+from .workbook import LazyWorkbook
+
+OUTPUT_FORMATS = ("xlsx", *EXPORT_FORMATS)
+
+
+def load_specs(path):
+    """
+    Read a saved filter set: a JSON list of FilterSpec.to_dict() objects,
+    or an object holding that list under "filters".
+    """
+    with open(path, encoding="utf-8") as source:
+        data = json.load(source)
+    if isinstance(data, dict):
+        data = data.get("filters", [])
+    if not isinstance(data, list) or not data:
+        raise ValueError(f"{path}: expected a non-empty list of filters")
+    return [FilterSpec.from_dict(item) for item in data]
+
+
+def find_workbooks(inputs):
+    """Expand files, directories (their *.xlsx) and glob patterns, sorted."""
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = glob.glob(os.path.join(glob.escape(item), "*.xlsx"))
+        elif os.path.isfile(item):
+            matches = [item]
+        else:
+            matches = glob.glob(item, recursive=True)
+        # Skip the lock files Excel leaves next to open workbooks.
+        paths.update(
+            os.path.abspath(path)
+            for path in matches
+            if os.path.isfile(path) and not os.path.basename(path).startswith("~$")
+        )
+    return sorted(paths)
+
+
+def output_stems(paths):
+    """
+    Output name stem of each workbook: its path relative to the folder the
+    inputs share, without the extension, so same-named workbooks in
+    different folders get separate outputs. Stems that still clash (e.g.
+    report.xlsx and report.XLSX) get a numeric suffix.
+    Returns:
+        {path: stem}
+    """
+    root = os.path.commonpath([os.path.dirname(path) for path in paths])
+    stems, taken = {}, set()
+    for path in paths:
+        stem = os.path.splitext(os.path.relpath(path, root))[0]
+        unique, number = stem, 1
+        while os.path.normcase(unique) in taken:
+            number += 1
+            unique = f"{stem}_{number}"
+        taken.add(os.path.normcase(unique))
+        stems[path] = unique
+    return stems
+
+
+def _output_path(output_dir, stem, file_format, sheet_name=None):
+    extension = ".xlsx" if file_format == "xlsx" else EXPORT_FORMATS[file_format][1]
+    if sheet_name is not None:
+        # One file per sheet, in a folder of its own per workbook.
+        path = os.path.join(output_dir, f"{stem}_filtered", f"{sheet_name}{extension}")
+    else:
+        path = os.path.join(output_dir, f"{stem}_filtered{extension}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def process_workbook(
+    path, specs, output_dir, sheet_name=None, file_format="xlsx", stem=None
+):
+    """
+    Filter one workbook and write its output.
+    Args:
+        path: .xlsx file to read.
+        specs: FilterSpecs, validated against each sheet as in the UI.
+        output_dir: directory for the output files.
+        sheet_name: sheet to filter; "*" for every sheet, None for the first.
+        file_format: "xlsx" or a key of EXPORT_FORMATS.
+        stem: output name stem, see output_stems; defaults to the file name.
+    Returns:
+        Manifest entry (dict) with per-sheet counts, outputs and timings.
+    """
+    entry = {"input": path, "outputs": [], "sheets": [], "seconds": {}}
+    if stem is None:
+        stem = os.path.splitext(os.path.basename(path))[0]
+    started = time.perf_counter()
+    try:
+        with open(path, "rb") as source:
+            sheets = LazyWorkbook(source.read())
+        if sheet_name == "*":
+            names = sheets.sheet_names
+        else:
+            names = [sheet_name or sheets.sheet_names[0]]
+        for name in names:
+            try:
+                sheets.load(name)
+            except Exception:
+                pass  # Reported as skipped by filter_sheet.
+        entry["seconds"]["read"] = round(time.perf_counter() - started, 3)
+
+        filtered = time.perf_counter()
+        results = [filter_sheet(sheets, name, specs) for name in names]
+        entry["seconds"]["filter"] = round(time.perf_counter() - filtered, 3)
+        for result in results:
+            entry["sheets"].append(
+                {
+                    "sheet": result.sheet_name,
+                    "rows": result.num_rows,
+                    "matches": result.matches,
+                    "skipped": result.reason,
+                }
+            )
+
+        written = time.perf_counter()
+        matched = [result for result in results if not result.skipped]
+        if file_format == "xlsx" and matched:
+            output = _output_path(output_dir, stem, file_format)
+            write_xlsx_sheets(
+                output,
+                (
+                    (
+                        result.sheet_name,
+                        sheets.load(result.sheet_name),
+                        result.mask.nonzero()[0],
+                        None,
+                    )
+                    for result in matched
+                ),
+            )
+            entry["outputs"].append(output)
+        elif matched:
+            for result in matched:
+                df = sheets.load(result.sheet_name)
+                output = _output_path(
+                    output_dir,
+                    stem,
+                    file_format,
+                    result.sheet_name if len(names) > 1 else None,
+                )
+                with open(output, "wb") as sink:
+                    sink.write(export_bytes(df[result.mask], file_format))
+                entry["outputs"].append(output)
+        entry["seconds"]["write"] = round(time.perf_counter() - written, 3)
+        entry["error"] = None
+    except Exception as e:
+        entry["error"] = f"{type(e).__name__}: {e}"
+    entry["seconds"]["total"] = round(time.perf_counter() - started, 3)
+    return entry
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m excelfilter",
+        description=(
+            "Apply a saved filter set to every workbook in a directory or glob "
+            "and write the filtered rows plus a JSON manifest."
+        ),
+        epilog=(
+            "Cache sizes come from the EXCELFILTER_* environment variables; "
+            "set EXCELFILTER_DISK_CACHE_MB=0 to keep parsed sheets off disk."
+        ),
+    )
+    parser.add_argument("spec", help="JSON file with the filter set")
+    parser.add_argument(
+        "inputs", nargs="+", help=".xlsx files, directories or glob patterns"
+    )
+    parser.add_argument(
+        "-o", "--output-dir", default="filtered", help="default: %(default)s"
+    )
+    sheets = parser.add_mutually_exclusive_group()
+    sheets.add_argument("--sheet", help="sheet to filter (default: the first)")
+    sheets.add_argument(
+        "--all-sheets",
+        action="store_true",
+        help="filter every sheet that has the columns",
+    )
+    parser.add_argument(
+        "-f", "--format", default="xlsx", choices=OUTPUT_FORMATS, dest="file_format"
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="worker processes (default: one per core, %(default)s)",
+    )
+    parser.add_argument(
+        "--manifest", help="manifest path (default: OUTPUT_DIR/manifest.json)"
+    )
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        specs = load_specs(args.spec)
+    except (OSError, ValueError, TypeError) as e:
+        print(f"Cannot read the filter set: {e}", file=sys.stderr)
+        return 2
+    paths = find_workbooks(args.inputs)
+    if not paths:
+        print("No .xlsx files found.", file=sys.stderr)
+        return 2
+    os.makedirs(args.output_dir, exist_ok=True)
+    stems = output_stems(paths)
+    sheet_name = "*" if args.all_sheets else args.sheet
+
+    started = datetime.datetime.now(datetime.timezone.utc)
+    timer = time.perf_counter()
+    entries = []
+    workers = max(1, min(args.workers, len(paths)))
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [
+            pool.submit(
+                process_workbook,
+                path,
+                specs,
+                args.output_dir,
+                sheet_name,
+                args.file_format,
+                stems[path],
+            )
+            for path in paths
+        ]
+        for future in as_completed(futures):
+            entry = future.result()
+            entries.append(entry)
+            matches = sum(sheet["matches"] or 0 for sheet in entry["sheets"])
+            status = entry["error"] or f"{matches} rows"
+            print(
+                f"{entry['input']}: {status} ({entry['seconds']['total']} s)",
+                file=sys.stderr,
+            )
+
+    entries.sort(key=lambda entry: entry["input"])
+    manifest = {
+        "started": started.isoformat(),
+        "seconds": round(time.perf_counter() - timer, 3),
+        "workers": workers,
+        "filters": [spec.to_dict() for spec in specs],
+        "sheet": sheet_name,
+        "format": args.file_format,
+        "files": entries,
+    }
+    manifest_path = args.manifest or os.path.join(args.output_dir, "manifest.json")
+    with open(manifest_path, "w", encoding="utf-8") as sink:
+        json.dump(manifest, sink, indent=2)
+    return 1 if any(entry["error"] for entry in entries) else 0
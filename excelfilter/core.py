@@ -0,0 +1,219 @@
+"""
+Streamlit-free entry points shared by every app: load a workbook, turn
+filter rows into validated specs, combine them into one mask, page and
+sort the views, and prepare and cache the exports.
+
+Nothing here draws anything. Problems are raised, FilterError (and its
+FilterValueError subclass) for filter rows, and each app shows them in its
+own words. Importing this module stays cheap: openpyxl, xlsxwriter and the
+pyarrow readers and writers are only imported by the calls that use them.
+"""
+
+from dataclasses import replace
+from io import BytesIO
+
+import pandas as pd
+
+from .batch import filter_sheets
+from .cache import read_excel_cached, read_excel_key
+from .dtypes import is_numeric_column
+from .export import (
+    EXCEL_MAX_ROWS,
+    EXPORT_FORMATS,
+    export_bytes,
+    export_files,
+    export_key,
+    file_bytes,
+    part_name,
+    prepare_export,
+    prepare_export_file,
+    prepared_export,
+    prepared_export_file,
+    write_xlsx,
+    write_xlsx_parts,
+    write_xlsx_sheets,
+)
+from .filters import (
+    CONNECTORS,
+    NULL_CRITERIA,
+    NUMERIC_CRITERIA,
+    TEXT_CRITERIA,
+    FilterError,
+    FilterPlan,
+    FilterSpec,
+    FilterValueError,
+    validate_spec,
+)
+from .indexes import build_text_indexes
+from .paging import page_frame, sort_order, view_positions
+from .workbook import LazyWorkbook, open_workbook
+
+__all__ = [
+    "EXCEL_MAX_ROWS",
+    "EXPORT_FORMATS",
+    "SPANISH_CRITERIA",
+    "FilterError",
+    "FilterSpec",
+    "FilterValueError",
+    "LazyWorkbook",
+    "apply_filters",
+    "build_spec",
+    "build_text_indexes",
+    "column_widths",
+    "connect",
+    "criteria_for",
+    "export_bytes",
+    "export_files",
+    "export_key",
+    "file_bytes",
+    "filter_mask",
+    "filter_sheets",
+    "load_excel",
+    "open_workbook",
+    "page_frame",
+    "prepare_export",
+    "prepare_export_file",
+    "prepared_export",
+    "prepared_export_file",
+    "sort_order",
+    "to_excel",
+    "view_positions",
+    "write_xlsx",
+    "write_xlsx_parts",
+    "write_xlsx_sheets",
+]
+
+# Criterion labels of the Spanish apps and their name in FilterSpec.
+SPANISH_CRITERIA = {
+    "Mayor que": "Greater than",
+    "Menor que": "Less than",
+    "Igual a": "Equal to",
+    "Diferente de": "Not equal to",
+    "Contiene": "Contains",
+    "No contiene": "Does not contain",
+    "Empieza con": "Starts with",
+    "Termina con": "Ends with",
+    "Es nulo": "Is null",
+    "No es nulo": "Is not null",
+}
+
+
+def load_excel(uploaded_file, **options):
+    """
+    Read an upload with pd.read_excel, once per distinct content.
+    Args:
+        uploaded_file: file-like object with the .xlsx bytes.
+        options: keyword arguments forwarded to pd.read_excel.
+    Returns:
+        (DataFrame, dataset_id); the id keys the mask and export caches.
+    Raises:
+        Whatever pd.read_excel raises for an unreadable file.
+    """
+    return read_excel_cached(uploaded_file, **options), read_excel_key(
+        uploaded_file, **options
+    )
+
+
+def criteria_for(series, labels=None):
+    """
+    Criteria offered for a column: comparisons for numeric columns, text
+    matches otherwise, then the null checks.
+    Args:
+        series: the column.
+        labels: optional mapping of UI labels to criteria, such as
+            SPANISH_CRITERIA; its labels are returned instead.
+    """
+    criteria = (
+        NUMERIC_CRITERIA if is_numeric_column(series) else TEXT_CRITERIA
+    ) + NULL_CRITERIA
+    if labels is None:
+        return list(criteria)
+    return [label for label, criterion in labels.items() if criterion in criteria]
+
+
+def build_spec(df, column, criterion, value=None, connector="AND", labels=None):
+    """
+    Validate one filter row against df.
+    Args:
+        df: DataFrame the row applies to.
+        column: column name.
+        criterion: criterion name, or a label of labels.
+        value: comparison value; ignored by the null criteria.
+        connector: "AND" or "OR", joining the row to the rows before it.
+        labels: optional mapping of UI labels to criteria.
+    Returns:
+        Validated FilterSpec.
+    Raises:
+        FilterValueError if the value does not fit the criterion,
+        FilterError if the column or criterion does not fit.
+    """
+    if labels is not None:
+        criterion = labels.get(criterion, criterion)
+    return validate_spec(df, FilterSpec(column, criterion, value, connector))
+
+
+def connect(specs, connectors):
+    """
+    Set the connectors of specs from a separate list, where connectors[i]
+    joins specs[i + 1] to the rows before it.
+    """
+    connectors = list(connectors)
+    for connector in connectors:
+        if connector not in CONNECTORS:
+            raise FilterError(f"Condition '{connector}' is not valid.")
+    return [
+        replace(spec, connector=connectors[i - 1]) if 0 < i <= len(connectors) else spec
+        for i, spec in enumerate(specs)
+    ]
+
+
+def filter_mask(df, specs, dataset_id=None):
+    """
+    Boolean row mask of the rows passing every spec, folded left to right.
+    Args:
+        df: DataFrame the specs were validated against.
+        specs: FilterSpecs; None entries (rows that failed) are skipped.
+        dataset_id: optional stable id of df, sharing the mask cache.
+    Returns:
+        ndarray, or None when there is no spec to apply.
+    """
+    specs = [spec for spec in specs if spec is not None]
+    if not specs:
+        return None
+    return FilterPlan(specs).evaluate(df, dataset_id)
+
+
+def apply_filters(df, specs, dataset_id=None):
+    """The rows of df selected by filter_mask; df itself without specs."""
+    mask = filter_mask(df, specs, dataset_id)
+    return df if mask is None else df[mask]
+
+
+def column_widths(df):
+    """Excel column widths fitting each header, at least 12 characters."""
+    return [max(len(str(column)) + 2, 12) for column in df.columns]
+
+
+def to_excel(df, sheet_name="Sheet1", widths=None, sheet_rows=None):
+    """
+    Write a DataFrame to an in-memory xlsx.
+    Args:
+        df: DataFrame to export; the index is not written.
+        sheet_name: name of the first sheet.
+        widths: optional column widths, e.g. column_widths(df).
+        sheet_rows: rows per sheet; longer results continue on
+            sheet_name_2, sheet_name_3... Defaults to the Excel row limit.
+    Returns:
+        bytes of the workbook.
+    """
+    output = BytesIO()
+    sheet_rows = sheet_rows or EXCEL_MAX_ROWS - 1
+    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+        for number, start in enumerate(range(0, max(len(df), 1), sheet_rows), 1):
+            name = part_name(sheet_name, number)
+            df.iloc[start : start + sheet_rows].to_excel(
+                writer, index=False, sheet_name=name
+            )
+            for i, width in enumerate(widths or ()):
+                writer.sheets[name].set_column(i, i, width)
+    return output.getvalue()
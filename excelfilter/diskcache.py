@@ -0,0 +1,150 @@
+"""Files cached on disk by key: Arrow IPC tables of parsed sheets, which are
+memory-mapped back on later loads, and prepared export files."""
+
+import hashlib
+import os
+import tempfile
+import threading
+from functools import lru_cache
+
+from . import settings
+
+# Bump when the parsed layout changes so stale files are not reused.
+FORMAT_VERSION = 4
+_SUFFIX = ".arrow"
+
+
+class DiskCache:
+    """Directory of cached files with a total size cap and LRU eviction."""
+
+    def __init__(self, directory, max_bytes, suffixes=(_SUFFIX,)):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Files with these suffixes are managed; the first is the default.
+        self.suffixes = tuple(suffixes)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def path_for(self, key, suffix=None):
+        digest = hashlib.blake2b(
+            repr((FORMAT_VERSION, key)).encode(), digest_size=16
+        ).hexdigest()
+        return os.path.join(self.directory, digest + (suffix or self.suffixes[0]))
+
+    def load(self, key):
+        """Memory-map the table stored for key, or return None."""
+        if not self.enabled:
+            return None
+        import pyarrow as pa
+
+        path = self.path_for(key)
+        try:
+            source = pa.memory_map(path, "r")
+        except OSError:
+            # Missing, or the cache directory is unreadable.
+            return None
+        try:
+            table = pa.ipc.open_file(source).read_all()
+        except pa.ArrowInvalid:
+            # Truncated or foreign file: drop it and parse again.
+            source.close()
+            self._remove(path)
+            return None
+        try:
+            self._touch(path)
+        except FileNotFoundError:
+            pass  # Evicted since it was mapped; the mapping stays valid.
+        return table
+
+    def store(self, key, table):
+        if not self.enabled:
+            return
+
+        import pyarrow as pa
+
+        def write(path):
+            with pa.OSFile(path, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+
+        self.store_file(key, write)
+
+    def file_path(self, key, suffix=None):
+        """Path of the file stored for key, or None."""
+        if not self.enabled:
+            return None
+        path = self.path_for(key, suffix)
+        try:
+            self._touch(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def store_file(self, key, write, suffix=None):
+        """
+        Store the file that write(path) creates under key.
+        Returns:
+            Path of the stored file.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path_for(key, suffix)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        # Keep the new file even when it alone exceeds the cap.
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        """
+        Delete least recently used files until the directory fits the cap,
+        sparing the file at path keep.
+        """
+        with self._lock:
+            entries = []
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(self.suffixes):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                self._remove(path)
+                total -= size
+
+    @staticmethod
+    def _touch(path):
+        # Refresh the modification time so eviction sees the file as recently
+        # used. A read-only cache, or files owned by another user, still serve
+        # their tables; only the LRU time goes stale.
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            raise
+        except OSError:
+            pass
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+@lru_cache(maxsize=None)
+def disk_cache():
+    """Process-wide disk cache configured from settings."""
+    return DiskCache(settings.DISK_CACHE_DIR, settings.DISK_CACHE_MB * 1024 * 1024)
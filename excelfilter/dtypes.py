@@ -0,0 +1,71 @@
+"""Column dtype checks and the optional memory-optimising dtype pass."""
+
+import numpy as np
+import pandas as pd
+
+from . import settings
+
+# Named by alias so the dtype, and pyarrow, are only built when used.
+ARROW_STRING = "string[pyarrow]"
+
+
+def is_numeric_column(series):
+    """True for int and float columns of any width, but not bool or nullable."""
+    dtype = series.dtype
+    return isinstance(dtype, np.dtype) and dtype.kind in "iuf"
+
+
+def is_text_column(series):
+    """True for object, string and text-categorical columns."""
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        dtype = dtype.categories.dtype
+    return dtype == "object" or isinstance(dtype, pd.StringDtype)
+
+
+def _is_text(series):
+    # Object columns qualify only when every cell is a string or missing.
+    values = series.dropna()
+    return len(values) == 0 or bool(values.map(type).eq(str).all())
+
+
+def _downcast(series):
+    kind = series.dtype.kind
+    if kind in "iu":
+        return pd.to_numeric(series, downcast="integer")
+    if kind == "f":
+        values = series.to_numpy()
+        narrow = values.astype(np.float32)
+        # Only when every value (and NaN) survives the round trip.
+        if np.array_equal(narrow.astype(np.float64), values, equal_nan=True):
+            return pd.Series(narrow, index=series.index, name=series.name)
+    return series
+
+
+def optimize_dtypes(df, max_ratio=None):
+    """
+    Shrink a DataFrame without changing its values.
+    Args:
+        df: DataFrame to optimise; it is not modified.
+        max_ratio: distinct values per row at or below which a text column
+            becomes categorical; defaults to settings.DICTIONARY_MAX_RATIO.
+    Returns:
+        (optimised DataFrame, {"before": bytes, "after": bytes})
+    """
+    if max_ratio is None:
+        max_ratio = settings.DICTIONARY_MAX_RATIO
+    before = int(df.memory_usage(deep=True).sum())
+    columns = {}
+    for column in df.columns:
+        series = df[column]
+        if is_numeric_column(series):
+            series = _downcast(series)
+        elif series.dtype == "object" and _is_text(series):
+            if len(series) and series.nunique() <= max_ratio * len(series):
+                series = series.astype("category")
+            else:
+                series = series.astype(ARROW_STRING)
+        columns[column] = series
+    optimized = pd.DataFrame(columns, index=df.index)
+    after = int(optimized.memory_usage(deep=True).sum())
+    return optimized, {"before": before, "after": after}
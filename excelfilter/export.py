@@ -0,0 +1,348 @@
+"""Export files built on request and cached by dataset, filters and format."""
+
+import datetime
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+
+import pandas as pd
+
+from . import settings
+from .cache import LRUCache
+from .diskcache import DiskCache
+from .registry import dataset_registry
+
+# Rows per worksheet Excel allows, header included.
+EXCEL_MAX_ROWS = 1_048_576
+
+# Rows converted to Python values at a time when writing in constant memory.
+EXPORT_CHUNK_ROWS = 10_000
+
+# Formats written straight from Arrow: label, file extension and MIME type.
+EXPORT_FORMATS = {
+    "csv": ("CSV", ".csv", "text/csv"),
+    "csv.gz": ("CSV (gzip)", ".csv.gz", "application/gzip"),
+    "parquet": ("Parquet", ".parquet", "application/vnd.apache.parquet"),
+    "arrow": ("Arrow IPC", ".arrow", "application/vnd.apache.arrow.file"),
+}
+
+
+@dataclass(frozen=True)
+class PreparedExport:
+    """Bytes of an export and the seconds it took to produce them."""
+
+    data: bytes
+    seconds: float
+
+    @property
+    def nbytes(self):
+        return len(self.data)
+
+
+@lru_cache(maxsize=None)
+def export_cache():
+    """Process-wide cache of prepared export files."""
+    return LRUCache(settings.EXPORT_CACHE_MB * 1024 * 1024, dataset_registry().in_use)
+
+
+@lru_cache(maxsize=None)
+def export_files():
+    """Process-wide directory of export files prepared on disk."""
+    return DiskCache(
+        os.path.join(settings.DISK_CACHE_DIR, "exports"),
+        settings.EXPORT_FILES_MB * 1024 * 1024,
+        suffixes=(".xlsx", ".zip"),
+    )
+
+
+def export_key(dataset_id, filters, file_format):
+    """
+    Cache key of an export.
+    Args:
+        dataset_id: stable id of the source data.
+        filters: hashable description of the filters that produced the rows.
+        file_format: output format, e.g. "xlsx".
+    """
+    return ("export", dataset_id, tuple(filters), file_format)
+
+
+def prepared_export(key):
+    """PreparedExport made earlier for key, or None."""
+    return export_cache().peek(key)
+
+
+def prepare_export(key, build):
+    """
+    Run build() to produce the export bytes, at most once per key.
+    Returns:
+        PreparedExport with the bytes and the build time.
+    """
+
+    def timed_build():
+        start = time.perf_counter()
+        data = build()
+        return PreparedExport(data, time.perf_counter() - start)
+
+    return export_cache().get_or_load(key, timed_build)
+
+
+def prepared_export_file(key, suffix=".xlsx"):
+    """Path of an export file prepared earlier, or None."""
+    return export_files().file_path(key, suffix)
+
+
+def prepare_export_file(key, write, suffix=".xlsx"):
+    """
+    Run write(path) to produce the export file, at most once per key.
+    Returns:
+        Path of the file in the export directory.
+    """
+    return prepared_export_file(key, suffix) or export_files().store_file(
+        key, write, suffix
+    )
+
+
+def part_name(name, number):
+    """Name of part number (from 1) of a split sheet: name, name_2, name_3..."""
+    if number == 1:
+        return name
+    suffix = f"_{number}"
+    # Sheet names are limited to 31 characters.
+    return name[: 31 - len(suffix)] + suffix
+
+
+def write_xlsx(
+    df,
+    path,
+    sheet_name="Sheet1",
+    rows=None,
+    column_widths=None,
+    chunk_rows=EXPORT_CHUNK_ROWS,
+    sheet_rows=None,
+):
+    """
+    Write a DataFrame to an xlsx file in constant memory, laid out like
+    df.to_excel(index=False).
+    Args:
+        df: DataFrame to export.
+        path: file to create.
+        sheet_name: name of the worksheet; further sheets get "_2", "_3"...
+        rows: optional positions of the rows to write, in order; defaults to
+            every row, so a filtered view never has to be copied.
+        column_widths: optional width per column.
+        chunk_rows: rows converted to Python values at a time.
+        sheet_rows: rows per worksheet, at most (and by default) the Excel
+            limit of EXCEL_MAX_ROWS - 1 below the header.
+    """
+    write_xlsx_sheets(
+        path, [(sheet_name, df, rows, column_widths)], chunk_rows, sheet_rows
+    )
+
+
+def write_xlsx_sheets(path, sheets, chunk_rows=EXPORT_CHUNK_ROWS, sheet_rows=None):
+    """
+    Write several DataFrames to one xlsx file in constant memory.
+    Args:
+        path: file to create.
+        sheets: iterable of (sheet_name, df, rows, column_widths) as taken by
+            write_xlsx; it is consumed one sheet at a time.
+        chunk_rows: rows converted to Python values at a time.
+        sheet_rows: rows per worksheet, see write_xlsx.
+    """
+    import xlsxwriter
+
+    sheet_rows = min(sheet_rows or EXCEL_MAX_ROWS - 1, EXCEL_MAX_ROWS - 1)
+    # constant_memory flushes each row to disk once the next one starts.
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+    try:
+        formats = {
+            "header": workbook.add_format(
+                {"bold": True, "border": 1, "align": "center", "valign": "top"}
+            ),
+            "datetime": workbook.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"}),
+            "date": workbook.add_format({"num_format": "yyyy-mm-dd"}),
+        }
+        for sheet_name, df, rows, column_widths in sheets:
+            num_rows = len(df) if rows is None else len(rows)
+            for number, sheet_start in enumerate(
+                range(0, max(num_rows, 1), sheet_rows), 1
+            ):
+                worksheet = workbook.add_worksheet(part_name(sheet_name, number))
+                for i, width in enumerate(column_widths or ()):
+                    worksheet.set_column(i, i, width)
+                for i, column in enumerate(df.columns):
+                    worksheet.write(0, i, str(column), formats["header"])
+                sheet_stop = min(sheet_start + sheet_rows, num_rows)
+                for start in range(sheet_start, sheet_stop, chunk_rows):
+                    stop = min(start + chunk_rows, sheet_stop)
+                    chunk = (
+                        df.iloc[start:stop]
+                        if rows is None
+                        else df.iloc[rows[start:stop]]
+                    )
+                    _write_rows(worksheet, formats, chunk, start - sheet_start + 1)
+    finally:
+        workbook.close()
+
+
+def _write_rows(worksheet, formats, chunk, first_row):
+    values = [chunk[column].tolist() for column in chunk.columns]
+    for excel_row, row in enumerate(zip(*values), first_row):
+        for i, value in enumerate(row):
+            if isinstance(value, str):
+                worksheet.write(excel_row, i, value)
+            elif value is None or pd.isna(value):
+                continue
+            elif isinstance(value, datetime.datetime):
+                worksheet.write_datetime(excel_row, i, value, formats["datetime"])
+            elif isinstance(value, datetime.date):
+                worksheet.write_datetime(excel_row, i, value, formats["date"])
+            else:
+                worksheet.write(excel_row, i, value)
+
+
+def _write_part(df, path, sheet_name, column_widths):
+    write_xlsx(df, path, sheet_name, column_widths=column_widths)
+    return path
+
+
+def write_xlsx_parts(
+    df,
+    path,
+    part_rows,
+    sheet_name="Sheet1",
+    rows=None,
+    column_widths=None,
+    max_workers=None,
+):
+    """
+    Split a DataFrame into workbooks of at most part_rows rows, written by
+    a process pool, and zip them to path in part order.
+    Args:
+        df: DataFrame to export.
+        path: zip file to create.
+        part_rows: rows per workbook, capped at the Excel limit.
+        sheet_name: worksheet name, also the stem of the part file names.
+        rows: optional positions of the rows to write, in order.
+        column_widths: optional width per column.
+        max_workers: processes to use; defaults to one per CPU.
+    """
+    part_rows = min(part_rows, EXCEL_MAX_ROWS - 1)
+    num_rows = len(df) if rows is None else len(rows)
+    starts = range(0, max(num_rows, 1), part_rows)
+    max_workers = min(len(starts), max_workers or os.cpu_count() or 1)
+    directory = tempfile.mkdtemp(dir=os.path.dirname(path) or None)
+    # Spawned workers do not inherit the locks of the server's threads.
+    context = multiprocessing.get_context("spawn")
+    try:
+        with ProcessPoolExecutor(max_workers, mp_context=context) as pool:
+            with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as archive:
+                # Parts are archived in part-number order, so the zip is the
+                # same from run to run whichever worker finishes first.
+                pending = deque()
+
+                def collect_oldest():
+                    future, name = pending.popleft()
+                    archive.write(future.result(), name)
+                    os.remove(future.result())
+
+                for number, start in enumerate(starts, 1):
+                    # Only max_workers parts are copied out at any time.
+                    if len(pending) >= max_workers:
+                        collect_oldest()
+                    stop = min(start + part_rows, num_rows)
+                    part = (
+                        df.iloc[start:stop]
+                        if rows is None
+                        else df.iloc[rows[start:stop]]
+                    )
+                    name = f"{part_name(sheet_name, number)}.xlsx"
+                    future = pool.submit(
+                        _write_part,
+                        part,
+                        os.path.join(directory, name),
+                        sheet_name,
+                        column_widths,
+                    )
+                    pending.append((future, name))
+                while pending:
+                    collect_oldest()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _arrow_table(df):
+    import pyarrow as pa
+
+    try:
+        # Converts the columns on several threads.
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        pass
+    columns = {}
+    for column in df.columns:
+        series = df[column]
+        try:
+            columns[str(column)] = pa.array(series, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Mixed cell types: written as text, as the streaming reader does.
+            columns[str(column)] = pa.array(
+                [None if pd.isna(v) else str(v) for v in series], pa.string()
+            )
+    return pa.table(columns)
+
+
+def export_bytes(df, file_format):
+    """
+    Write a DataFrame through Arrow in one of EXPORT_FORMATS.
+    Args:
+        df: DataFrame to export; the index is not written.
+        file_format: key of EXPORT_FORMATS.
+    Returns:
+        bytes of the file.
+    """
+    # The Arrow writers are only imported by the formats that use them.
+    import pyarrow as pa
+
+    table = _arrow_table(df)
+    sink = pa.BufferOutputStream()
+    match file_format:
+        case "csv":
+            import pyarrow.csv as pa_csv
+
+            pa_csv.write_csv(table, sink)
+        case "csv.gz":
+            import pyarrow.csv as pa_csv
+
+            with pa.CompressedOutputStream(sink, "gzip") as stream:
+                pa_csv.write_csv(table, stream)
+        case "parquet":
+            import pyarrow.parquet as pq
+
+            pq.write_table(table, sink)
+        case "arrow":
+            options = pa.ipc.IpcWriteOptions(use_threads=True)
+            with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+                writer.write_table(table)
+        case _:
+            raise ValueError(f"Export format '{file_format}' is not supported.")
+    return sink.getvalue().to_pybytes()
+
+
+def file_bytes(write):
+    """Run write(path) on a temporary file and return the file's bytes."""
+    fd, path = tempfile.mkstemp(suffix=".tmp")
+    os.close(fd)
+    try:
+        write(path)
+        with open(path, "rb") as source:
+            return source.read()
+    finally:
+        os.remove(path)
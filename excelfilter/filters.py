@@ -0,0 +1,414 @@
+"""Filter specifications compiled into a plan evaluated in a single pass."""
+
+import threading
+from collections import OrderedDict, deque
+from dataclasses import asdict, dataclass, replace
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from . import settings
+from .cache import LRUCache
+from .dtypes import is_numeric_column, is_text_column
+from .indexes import affix_index, sorted_index, trigram_index
+from .registry import dataset_registry
+
+NUMERIC_CRITERIA = ("Greater than", "Less than", "Equal to", "Not equal to")
+TEXT_CRITERIA = ("Contains", "Does not contain", "Starts with", "Ends with")
+NULL_CRITERIA = ("Is null", "Is not null")
+CONNECTORS = ("AND", "OR")
+
+# Below this fraction of candidate rows a cheap vectorised predicate is
+# evaluated on the candidates only; text predicates always are, since each
+# cell costs a Python-level string operation.
+NUMERIC_SUBSET_FRACTION = 0.1
+
+
+class FilterError(ValueError):
+    """A filter row that cannot be applied to the selected column."""
+
+
+class FilterValueError(FilterError):
+    """The value of a filter row does not fit its criterion."""
+
+
+@dataclass(frozen=True)
+class FilterSpec:
+    """
+    One filter row as entered in the UI.
+    Attributes:
+        column: column the filter applies to.
+        criterion: one of NUMERIC_CRITERIA, TEXT_CRITERIA or NULL_CRITERIA.
+        value: comparison value; unused for the null criteria.
+        connector: "AND" or "OR", joining this row to the rows before it.
+    """
+
+    column: str
+    criterion: str
+    value: object = None
+    connector: str = "AND"
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+def validate_spec(df, spec):
+    """
+    Check a spec against the DataFrame and normalise its value.
+    Returns:
+        FilterSpec whose value is a float for numeric criteria.
+    Raises:
+        FilterError if the column, criterion or value does not fit.
+    """
+    if spec.connector not in CONNECTORS:
+        raise FilterError(f"Condition '{spec.connector}' is not valid.")
+    if spec.column not in df.columns:
+        raise FilterError(f"Column '{spec.column}' does not exist.")
+    series = df[spec.column]
+    if spec.criterion in NULL_CRITERIA:
+        return replace(spec, value=None)
+    if spec.criterion in NUMERIC_CRITERIA and is_numeric_column(series):
+        try:
+            return replace(spec, value=float(spec.value))
+        except (TypeError, ValueError):
+            raise FilterValueError(
+                f"The entered value is not valid for the criterion '{spec.criterion}'."
+            ) from None
+    if spec.criterion in TEXT_CRITERIA and is_text_column(series):
+        return replace(spec, value="" if spec.value is None else str(spec.value))
+    raise FilterError(
+        f"Criterion '{spec.criterion}' is not valid for the selected column."
+    )
+
+
+def evaluate_spec(series, spec, rows=None):
+    """
+    Evaluate one validated spec.
+    Args:
+        series: the column the spec refers to.
+        spec: FilterSpec returned by validate_spec.
+        rows: optional positions to evaluate; defaults to every row.
+    Returns:
+        Boolean ndarray aligned with rows (or with the whole column).
+    """
+    if rows is not None:
+        series = series.iloc[rows]
+    if spec.criterion in TEXT_CRITERIA and isinstance(
+        series.dtype, pd.CategoricalDtype
+    ):
+        return _evaluate_categories(series, spec)
+    value = spec.value
+    if spec.criterion in NUMERIC_CRITERIA:
+        # Compare in float64 even when the column was downcast.
+        value = np.float64(value)
+    match spec.criterion:
+        case "Is null":
+            result = series.isnull()
+        case "Is not null":
+            result = series.notnull()
+        case "Greater than":
+            return series.to_numpy() > value
+        case "Less than":
+            return series.to_numpy() < value
+        case "Equal to":
+            return series.to_numpy() == value
+        case "Not equal to":
+            return series.to_numpy() != value
+        case "Contains":
+            result = series.str.contains(value, case=False, regex=False, na=False)
+        case "Does not contain":
+            result = ~series.str.contains(value, case=False, regex=False, na=False)
+        case "Starts with":
+            result = series.str.startswith(value, na=False)
+        case "Ends with":
+            result = series.str.endswith(value, na=False)
+        case _:
+            raise FilterError(f"Criterion '{spec.criterion}' is not supported.")
+    return np.asarray(result, dtype=bool)
+
+
+def _evaluate_categories(series, spec):
+    # One string operation per distinct value, gathered to rows by code.
+    codes = series.cat.codes.to_numpy()
+    if len(codes) < len(series.cat.categories):
+        # A subset of rows (candidates, a refinement): evaluate only the
+        # categories it holds rather than every one of the column.
+        present, codes = np.unique(codes, return_inverse=True)
+        values = np.asarray(series.cat.categories, dtype=object).take(present)
+        values[present < 0] = None
+        return evaluate_spec(pd.Series(values, dtype=object), spec)[codes]
+    categories = pd.Series(series.cat.categories, dtype=object)
+    matched = evaluate_spec(categories, spec)
+    # Code -1 (missing) reads the trailing slot, as a missing object cell
+    # would evaluate.
+    missing = evaluate_spec(pd.Series([None], dtype=object), spec)
+    return np.append(matched, missing)[codes]
+
+
+# Text criteria for which a value that extends an earlier one can only match
+# rows the earlier one matched ("acm" -> "acme" -> "acme c").
+_REFINEMENTS = {
+    "Contains": lambda old, new: old in new,
+    "Starts with": lambda old, new: new.startswith(old),
+    "Ends with": lambda old, new: new.endswith(old),
+}
+# Values remembered per (dataset, column, criterion) when looking for a base.
+_REFINEMENT_HISTORY = 32
+
+# Numeric criteria answered by a binary search over a SortedIndex.
+_INDEXED = ("Greater than", "Less than", "Equal to")
+
+# Criteria evaluated as the negation of another one, so both share a mask.
+_NEGATIONS = {
+    "Does not contain": "Contains",
+    "Not equal to": "Equal to",
+    "Is not null": "Is null",
+}
+
+
+@lru_cache(maxsize=None)
+def mask_cache():
+    """Process-wide cache of predicate and plan masks, keyed by dataset id."""
+    return LRUCache(settings.MASK_CACHE_MB * 1024 * 1024, dataset_registry().in_use)
+
+
+class PredicateMask:
+    """
+    Memoised result of one predicate over a dataset.
+
+    Rows are evaluated on demand: a plan that only needs the rows still
+    selected fills in those, and later plans reuse whatever is known.
+    """
+
+    def __init__(self, num_rows):
+        self.result = np.zeros(num_rows, dtype=bool)
+        self.known = np.zeros(num_rows, dtype=bool)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_result(cls, result):
+        """Mask whose every row is already evaluated."""
+        mask = cls(0)
+        mask.result, mask.known = result, None
+        return mask
+
+    @classmethod
+    def refining(cls, base):
+        """
+        Mask for a predicate that can only match rows base matches: every row
+        base is known to reject starts out known and rejected.
+        """
+        mask = cls(len(base.result))
+        with base._lock:
+            if base.known is None:
+                np.logical_not(base.result, out=mask.known)
+            else:
+                np.greater(base.known, base.result, out=mask.known)
+        return mask
+
+    @property
+    def nbytes(self):
+        return self.result.nbytes + (0 if self.known is None else self.known.nbytes)
+
+    def evaluate(self, series, spec, rows=None):
+        """
+        Result for the given positions (or every row), evaluating only the
+        positions not seen before. The returned array must not be modified.
+        """
+        with self._lock:
+            if self.known is not None:
+                if rows is None:
+                    missing = np.flatnonzero(~self.known)
+                else:
+                    missing = rows[~self.known[rows]]
+                if len(missing) == len(self.result):
+                    self.result[:] = evaluate_spec(series, spec)
+                elif len(missing):
+                    self.result[missing] = evaluate_spec(series, spec, missing)
+                self.known[missing] = True
+                if rows is None or len(missing) and self.known.all():
+                    self.known = None
+            return self.result if rows is None else self.result[rows]
+
+
+class FilterPlan:
+    """
+    Validated filter rows folded left to right, as the UI presents them.
+
+    Every referenced column is looked up once and the rows are combined into
+    a single boolean buffer updated in place. After the first row, a row is
+    evaluated only on the positions whose outcome it can still change (the
+    rows still selected for AND, the rows not yet selected for OR), so a
+    selective chain costs little more than its first scan.
+
+    With a dataset id, each predicate's mask and each prefix of the chain are
+    memoised in mask_cache(), so editing one row re-evaluates that predicate
+    only and folds the rows after it onto the cached prefix.
+    """
+
+    def __init__(self, specs):
+        self.specs = tuple(specs)
+
+    @classmethod
+    def compile(cls, df, specs):
+        return cls(validate_spec(df, spec) for spec in specs)
+
+    def __len__(self):
+        return len(self.specs)
+
+    def prefix_key(self, dataset_id, length):
+        # The connector of the first row joins nothing, so it is not part of it.
+        specs = self.specs[:length]
+        specs = (replace(specs[0], connector="AND"),) + specs[1:]
+        return ("plan", dataset_id, specs)
+
+    def evaluate(self, df, dataset_id=None):
+        """
+        Boolean ndarray selecting the rows of df that pass the plan.
+        Args:
+            df: DataFrame the plan was validated against.
+            dataset_id: optional stable id of df; when given, intermediate
+                results are shared through mask_cache() and the returned
+                array is read-only.
+        """
+        if not self.specs:
+            return np.ones(len(df), dtype=bool)
+        cache = mask_cache() if dataset_id is not None else None
+        columns = {spec.column: df[spec.column] for spec in self.specs}
+
+        # Resume from the longest chain prefix already evaluated.
+        start, combined = 0, None
+        if cache is not None:
+            for length in range(len(self.specs), 0, -1):
+                combined = cache.get(self.prefix_key(dataset_id, length))
+                if combined is not None:
+                    start = length
+                    break
+        if start == len(self.specs):
+            return combined
+
+        predicates = {}
+        for index in range(start, len(self.specs)):
+            spec = self.specs[index]
+            base = _NEGATIONS.get(spec.criterion, spec.criterion)
+            value = spec.value.upper() if base == "Contains" else spec.value
+            key = ("predicate", dataset_id, spec.column, base, value)
+            if key not in predicates:
+                predicates[key] = (
+                    cache.get_or_load(
+                        key,
+                        lambda: _new_predicate_mask(cache, key, columns[spec.column]),
+                    )
+                    if cache is not None
+                    else PredicateMask(len(df))
+                )
+            mask = predicates[key]
+            series = columns[spec.column]
+            base_spec = replace(spec, criterion=base)
+            negate = base != spec.criterion
+            if combined is None:
+                combined = mask.evaluate(series, base_spec)
+                combined = ~combined if negate else combined.copy()
+            else:
+                combined = combined.copy() if index == start else combined
+                _fold(combined, series, base_spec, mask, spec.connector, negate)
+            if cache is not None and index < len(self.specs) - 1:
+                cache.put(self.prefix_key(dataset_id, index + 1), _frozen(combined))
+        if cache is not None:
+            cache.put(self.prefix_key(dataset_id, len(self.specs)), combined)
+            combined.flags.writeable = False
+        return combined
+
+    def apply(self, df, dataset_id=None):
+        if not self.specs:
+            return df
+        return df[self.evaluate(df, dataset_id)]
+
+
+_history = OrderedDict()
+_history_lock = threading.Lock()
+
+
+def _new_predicate_mask(cache, key, series):
+    """
+    Start a predicate mask. Numeric comparisons are answered from the
+    column's sorted index when selective enough, "Contains" from its trigram
+    index and "Starts with" / "Ends with" from its prefix/suffix index once
+    built; otherwise text criteria are seeded
+    from a cached predicate on the same column whose value they refine, so
+    only the rows that one matched are scanned.
+    """
+    _, dataset_id, column, criterion, value = key
+    num_rows = len(series)
+    if (
+        criterion in _INDEXED
+        and settings.SORTED_INDEX
+        and num_rows >= settings.SORTED_INDEX_MIN_ROWS
+    ):
+        result = sorted_index(series, dataset_id, column).mask(criterion, value)
+        if result is not None:
+            return PredicateMask.from_result(result)
+    if criterion == "Contains":
+        index = trigram_index(dataset_id, column)
+        if index is not None:
+            return PredicateMask.from_result(index.contains(value))
+    if criterion in ("Starts with", "Ends with"):
+        index = affix_index(series, dataset_id, column)
+        if index is not None:
+            return PredicateMask.from_result(index.match(criterion, value))
+    refines = _REFINEMENTS.get(criterion)
+    if refines is None:
+        return PredicateMask(num_rows)
+    group = (dataset_id, column, criterion)
+    with _history_lock:
+        values = _history.setdefault(group, deque(maxlen=_REFINEMENT_HISTORY))
+        _history.move_to_end(group)
+        while len(_history) > 1024:
+            _history.popitem(last=False)
+        candidates = [old for old in values if old != value and refines(old, value)]
+        values.append(value)
+    # The longest earlier value is the most selective base.
+    for old in sorted(candidates, key=len, reverse=True):
+        base = cache.get(("predicate", dataset_id, column, criterion, old))
+        if base is not None:
+            return PredicateMask.refining(base)
+    return PredicateMask(num_rows)
+
+
+def _frozen(array):
+    copy = array.copy()
+    copy.flags.writeable = False
+    return copy
+
+
+def _fold(combined, series, spec, mask, connector, negate):
+    is_and = connector == "AND"
+    # AND can only clear selected rows; OR can only set unselected ones.
+    candidates = np.count_nonzero(combined)
+    if not is_and:
+        candidates = len(combined) - candidates
+    if candidates == 0:
+        return
+    threshold = 1.0 if spec.criterion in TEXT_CRITERIA else NUMERIC_SUBSET_FRACTION
+    if candidates < threshold * len(combined):
+        rows = np.flatnonzero(combined if is_and else ~combined)
+        matched = mask.evaluate(series, spec, rows)
+        if negate:
+            matched = ~matched
+        if is_and:
+            combined[rows[~matched]] = False
+        else:
+            combined[rows[matched]] = True
+        return
+    matched = mask.evaluate(series, spec)
+    if negate:
+        matched = ~matched
+    if is_and:
+        np.logical_and(combined, matched, out=combined)
+    else:
+        np.logical_or(combined, matched, out=combined)
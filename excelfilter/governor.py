@@ -0,0 +1,170 @@
+"""
+Global ceiling on the memory of the datasets sessions hold.
+
+A session keeps only filter specs in st.session_state; its data lives in the
+shared caches under the content digest of its workbook. The governor adds up
+those entries per dataset and, above the ceiling, spills the datasets of the
+largest idle sessions: parsed sheets are written to the disk cache as Arrow
+IPC, then every entry of the dataset leaves memory. The next rerun of such a
+session finds its sheets missing and LazyWorkbook.load memory-maps them back;
+masks, indexes and exports are rebuilt on demand.
+"""
+
+import logging
+import threading
+from functools import lru_cache
+
+from . import settings
+from .cache import workbook_cache
+from .diskcache import disk_cache
+from .export import export_cache
+from .filters import mask_cache
+from .registry import dataset_registry, key_parts
+
+logger = logging.getLogger(__name__)
+
+
+def _store_sheet(key, frame):
+    import pyarrow as pa
+
+    disk = disk_cache()
+    if not disk.enabled or disk.file_path(key) is not None:
+        return
+    try:
+        disk.store(key, pa.Table.from_pandas(frame, preserve_index=False))
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OSError):
+        # Dropped anyway; the sheet is parsed from the upload again.
+        logger.warning("Could not spill sheet %r to disk", key, exc_info=True)
+
+
+class MemoryGovernor:
+    """
+    Spills the cached data of idle sessions when the data of all sessions
+    exceeds max_bytes. A dataset shared with a session that is not idle is
+    never spilled.
+    """
+
+    def __init__(self, max_bytes, idle_seconds, registry=None, caches=None):
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.registry = registry or dataset_registry()
+        self.caches = caches or (workbook_cache(), mask_cache(), export_cache())
+        self.spills = 0
+        self.spilled_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def dataset_bytes(self):
+        """Bytes of cached entries per digest held by some session."""
+        held = {
+            digest
+            for session_id in self.registry.sessions()
+            for digest in self.registry.datasets(session_id)
+        }
+        sizes = dict.fromkeys(held, 0)
+        for cache in self.caches:
+            for key, _, size in cache.entries():
+                for digest in set(key_parts(key)) & held:
+                    sizes[digest] += size
+        return sizes
+
+    def session_bytes(self, sizes=None):
+        """
+        Bytes of each session's datasets; shared datasets count in full for
+        every session holding them.
+        """
+        sizes = self.dataset_bytes() if sizes is None else sizes
+        return {
+            session_id: sum(
+                sizes.get(digest, 0) for digest in self.registry.datasets(session_id)
+            )
+            for session_id in self.registry.sessions()
+        }
+
+    def _is_idle(self, session_id, active):
+        if session_id == active:
+            return False
+        idle = self.registry.idle_seconds(session_id)
+        return idle is not None and idle >= self.idle_seconds
+
+    def enforce(self, active_session=None):
+        """
+        Spill datasets of idle sessions, largest session first, until the
+        held data fits the ceiling. Skipped while another session enforces.
+        Args:
+            active_session: the session running now, never treated as idle.
+        Returns:
+            digests spilled.
+        """
+        if not self.enabled or not self._lock.acquire(blocking=False):
+            return []
+        try:
+            sizes = self.dataset_bytes()
+            total = sum(sizes.values())
+            if total <= self.max_bytes:
+                return []
+            busy = {
+                digest
+                for session_id in self.registry.sessions()
+                if not self._is_idle(session_id, active_session)
+                for digest in self.registry.datasets(session_id)
+            }
+            per_session = self.session_bytes(sizes)
+            idle = sorted(
+                (s for s in per_session if self._is_idle(s, active_session)),
+                key=per_session.get,
+                reverse=True,
+            )
+            spilled = []
+            for session_id in idle:
+                for digest in self.registry.datasets(session_id):
+                    if total <= self.max_bytes:
+                        return spilled
+                    if digest in busy or digest in spilled or not sizes[digest]:
+                        continue
+                    total -= self.spill(digest)
+                    spilled.append(digest)
+            return spilled
+        finally:
+            self._lock.release()
+
+    def spill(self, digest):
+        """
+        Move the cached data of one dataset out of memory, writing its parsed
+        sheets to the disk cache first.
+        Returns:
+            bytes released.
+        """
+        released = 0
+        for cache in self.caches:
+            for key, value, size in cache.entries():
+                if digest not in key_parts(key):
+                    continue
+                if key[0] == "sheet":
+                    _store_sheet(key, value)
+                if cache.pop(key) is not None:
+                    released += size
+        self.spills += 1
+        self.spilled_bytes += released
+        logger.info("Spilled dataset %s (%d bytes)", digest, released)
+        return released
+
+    def stats(self):
+        sizes = self.dataset_bytes()
+        return {
+            "bytes": sum(sizes.values()),
+            "max_bytes": self.max_bytes,
+            "spills": self.spills,
+            "spilled_bytes": self.spilled_bytes,
+        }
+
+
+@lru_cache(maxsize=None)
+def memory_governor():
+    """Process-wide governor configured from settings."""
+    return MemoryGovernor(
+        settings.SESSION_MEMORY_MB * 1024 * 1024, settings.SESSION_IDLE_SECONDS
+    )
@@ -0,0 +1,402 @@
+"""Per-column indexes built lazily and cached alongside the parsed dataset."""
+
+import logging
+import math
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from . import settings
+from .cache import estimate_size, workbook_cache
+
+logger = logging.getLogger(__name__)
+
+# An index answer is used when it selects (or rejects) at most this fraction
+# of the rows; past that, scattering row ids costs more than a vector scan.
+INDEX_SELECTIVITY = 0.125
+
+
+class SortedIndex:
+    """
+    Argsort permutation and sorted values of a numeric column.
+
+    Values are kept as float64, which is how pandas compares a column with a
+    float threshold, and NaN rows sort last outside the searchable range.
+    """
+
+    def __init__(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        order_dtype = np.int32 if len(values) < 2**31 else np.int64
+        self.order = np.argsort(values, kind="stable").astype(order_dtype)
+        self.values = values[self.order]
+        self.num_valid = len(values) - int(np.count_nonzero(np.isnan(self.values)))
+
+    @property
+    def nbytes(self):
+        return self.order.nbytes + self.values.nbytes
+
+    def row_range(self, criterion, value):
+        """Positions [start, stop) in sorted order of the rows that match."""
+        if math.isnan(value):
+            return 0, 0
+        valid = self.values[: self.num_valid]
+        match criterion:
+            case "Greater than":
+                return int(np.searchsorted(valid, value, "right")), self.num_valid
+            case "Less than":
+                return 0, int(np.searchsorted(valid, value, "left"))
+            case "Equal to":
+                return (
+                    int(np.searchsorted(valid, value, "left")),
+                    int(np.searchsorted(valid, value, "right")),
+                )
+        raise ValueError(f"Criterion '{criterion}' is not indexed.")
+
+    def mask(self, criterion, value):
+        """
+        Boolean row mask for the comparison, or None when the match is too
+        broad for the index to beat a scan.
+        """
+        start, stop = self.row_range(criterion, value)
+        num_rows = len(self.order)
+        hits = stop - start
+        if hits <= INDEX_SELECTIVITY * num_rows:
+            mask = np.zeros(num_rows, dtype=bool)
+            mask[self.order[start:stop]] = True
+            return mask
+        if num_rows - hits <= INDEX_SELECTIVITY * num_rows:
+            mask = np.ones(num_rows, dtype=bool)
+            mask[self.order[:start]] = False
+            mask[self.order[stop:]] = False
+            return mask
+        return None
+
+
+def sorted_index(series, dataset_id, column):
+    """SortedIndex of a dataset column, built on first use and then cached."""
+    return workbook_cache().get_or_load(
+        ("sorted_index", dataset_id, column), lambda: SortedIndex(series.to_numpy())
+    )
+
+
+# Characters of distinct values encoded at a time while building a
+# TrigramIndex, bounding its temporary arrays.
+TRIGRAM_CHUNK_CHARS = 1 << 18
+
+
+def _char_codes(text):
+    return np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+
+
+def _trigram_codes(chars, size, dtype):
+    # One integer per window of three characters, given in alphabet positions.
+    chars = chars.astype(dtype, copy=False)
+    codes = chars[:-2].copy()
+    codes *= size
+    codes += chars[1:-1]
+    codes *= size
+    codes += chars[2:]
+    return codes
+
+
+def _text_chunks(texts, lengths):
+    # Runs of values of about TRIGRAM_CHUNK_CHARS characters, NUL-joined so
+    # no trigram spans two values.
+    ends = np.cumsum(lengths + 1)
+    cuts = np.searchsorted(
+        ends,
+        np.arange(
+            TRIGRAM_CHUNK_CHARS, ends[-1] if len(ends) else 0, TRIGRAM_CHUNK_CHARS
+        ),
+        side="right",
+    )
+    edges = [0, *cuts.tolist(), len(texts)]
+    for first, stop in zip(edges, edges[1:]):
+        if stop > first:
+            yield first, _char_codes("\0".join(texts[first:stop])), lengths[first:stop]
+
+
+def _group_starts(codes):
+    # Positions where each run of equal sorted codes begins.
+    starts = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+    return np.concatenate([[0], starts]) if len(codes) else starts
+
+
+class TrigramIndex:
+    """
+    Inverted index from upper-cased character trigrams to the distinct values
+    of a text column that contain them.
+
+    Matching is literal and case-insensitive, like
+    str.contains(value, case=False, regex=False): candidates come from the
+    posting lists, are verified with a substring test, and are mapped back to
+    rows through the column codes.
+
+    The postings are built in NumPy, a chunk of values at a time: each
+    trigram becomes an integer code, and sorting the (code, value id) pairs
+    groups the ascending value ids of each trigram in one flat int32 array.
+    """
+
+    def __init__(self, series):
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        self.codes = codes.astype(np.int32 if len(uniques) < 2**31 else np.int64)
+        # Non-text cells never match, as str.contains gives NaN for them.
+        self.values = [
+            value.upper() if isinstance(value, str) else None for value in uniques
+        ]
+        texts = ["" if value is None else value for value in self.values]
+        lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+
+        counts = np.zeros(1, dtype=np.int64)
+        for _, chars, _ in _text_chunks(texts, lengths):
+            found = np.bincount(chars)
+            if len(found) > len(counts):
+                counts = np.pad(counts, (0, len(found) - len(counts)))
+            counts[: len(found)] += found
+        self.alphabet = np.flatnonzero(counts).astype(np.uint32)
+        lookup = np.zeros(len(counts), dtype=np.uint32)
+        lookup[self.alphabet] = np.arange(len(self.alphabet), dtype=np.uint32)
+        del counts
+        size = len(self.alphabet)
+        self._code_type = np.uint32 if size**3 < 2**32 else np.uint64
+
+        # (code, value id) pairs packed into one 64-bit key when they fit,
+        # sorted in place without an index array.
+        values = max(len(texts), 1)
+        packed = size**3 * values < 2**64
+        keys = np.empty(int(lengths.sum()), dtype=np.uint64) if packed else None
+        pairs, filled = [], 0
+        for first, chars, chunk_lengths in _text_chunks(texts, lengths):
+            if len(chars) < 3:
+                continue
+            chars = lookup[chars]
+            separator = (
+                chars == 0 if self.alphabet[0] == 0 else np.zeros(len(chars), bool)
+            )
+            whole = ~(separator[:-2] | separator[1:-1] | separator[2:])
+            grams = _trigram_codes(chars, size, self._code_type)[whole]
+            ids = np.repeat(
+                np.arange(first, first + len(chunk_lengths), dtype=np.uint32),
+                chunk_lengths + 1,
+            )[: len(chars) - 2][whole]
+            if packed:
+                # A value repeating a trigram is listed once.
+                chunk = np.unique(grams.astype(np.uint64) * np.uint64(values) + ids)
+                keys[filled : filled + len(chunk)] = chunk
+                filled += len(chunk)
+            else:
+                pairs.append((grams, ids))
+        del texts, lookup
+
+        if packed:
+            keys = keys[:filled]
+            keys.sort()
+            ids = np.empty(len(keys), dtype=np.int32)
+            np.remainder(keys, np.uint64(values), out=ids, casting="unsafe")
+            keys //= np.uint64(values)
+            starts = _group_starts(keys)
+            self.grams = keys[starts].astype(self._code_type)
+            del keys
+        else:
+            grams = np.concatenate([g for g, _ in pairs] or [np.empty(0, np.uint64)])
+            ids = np.concatenate([i for _, i in pairs] or [np.empty(0, np.uint32)])
+            del pairs
+            order = np.lexsort((ids, grams))
+            grams, ids = grams[order], ids[order].astype(np.int32)
+            del order
+            keep = np.ones(len(grams), dtype=bool)
+            keep[1:] = (grams[1:] != grams[:-1]) | (ids[1:] != ids[:-1])
+            grams, ids = grams[keep], ids[keep]
+            starts = _group_starts(grams)
+            self.grams = grams[starts]
+        self.offsets = np.append(starts, len(ids))
+        self.ids = ids
+
+    @property
+    def nbytes(self):
+        return (
+            self.codes.nbytes
+            + self.alphabet.nbytes
+            + self.grams.nbytes
+            + self.offsets.nbytes
+            + self.ids.nbytes
+            + estimate_size(self.values)
+        )
+
+    def _postings(self, needle):
+        # Value ids per distinct trigram of needle, or None if one is absent.
+        chars = _char_codes(needle)
+        positions = np.searchsorted(self.alphabet, chars)
+        if (positions >= len(self.alphabet)).any() or (
+            self.alphabet[positions] != chars
+        ).any():
+            return None
+        grams = np.unique(
+            _trigram_codes(positions, len(self.alphabet), self._code_type)
+        )
+        found = np.searchsorted(self.grams, grams)
+        if (found >= len(self.grams)).any() or (self.grams[found] != grams).any():
+            return None
+        return [self.ids[self.offsets[k] : self.offsets[k + 1]] for k in found]
+
+    def matching_values(self, needle):
+        """Ids of the distinct values containing needle (upper-cased)."""
+        if len(needle) < 3 or "\0" in needle:
+            candidates = range(len(self.values))
+        else:
+            lists = self._postings(needle)
+            if lists is None:
+                return np.empty(0, dtype=np.int64)
+            lists.sort(key=len)
+            candidates = lists[0]
+            for ids in lists[1:]:
+                candidates = np.intersect1d(candidates, ids, assume_unique=True)
+        values = self.values
+        return np.array(
+            [i for i in candidates if values[i] is not None and needle in values[i]],
+            dtype=np.int64,
+        )
+
+    def contains(self, value):
+        """Row mask of the cells containing value, ignoring case."""
+        hit = np.zeros(len(self.values) + 1, dtype=bool)
+        hit[self.matching_values(value.upper())] = True
+        # Code -1 (missing) lands on the trailing False slot.
+        return hit[self.codes]
+
+
+class AffixIndex:
+    """
+    Sorted keys for "Starts with" and "Ends with" on a text column: the
+    distinct values sorted as-is for prefixes and reversed for suffixes, so a
+    match is two binary searches plus a gather through the column codes.
+    Matching is case-sensitive, like str.startswith / str.endswith.
+    """
+
+    def __init__(self, series):
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        self.codes = codes.astype(np.int32 if len(uniques) < 2**31 else np.int64)
+        self.num_values = len(uniques)
+        # Non-text cells never match, as the str methods give NaN for them.
+        text_ids = np.array(
+            [i for i, value in enumerate(uniques) if isinstance(value, str)],
+            dtype=np.int64,
+        )
+        texts = np.asarray(uniques, dtype=object)[text_ids]
+        order = np.argsort(texts, kind="stable")
+        self.prefix_keys, self.prefix_ids = texts[order], text_ids[order]
+        reversed_texts = np.array([text[::-1] for text in texts], dtype=object)
+        order = np.argsort(reversed_texts, kind="stable")
+        self.suffix_keys, self.suffix_ids = reversed_texts[order], text_ids[order]
+
+    @property
+    def nbytes(self):
+        return (
+            self.codes.nbytes
+            + self.prefix_ids.nbytes
+            + self.suffix_ids.nbytes
+            + estimate_size(list(self.prefix_keys))
+            + estimate_size(list(self.suffix_keys))
+        )
+
+    def match(self, criterion, value):
+        """Row mask for "Starts with" or "Ends with" value."""
+        if criterion == "Starts with":
+            ids = _prefix_range(self.prefix_keys, self.prefix_ids, value)
+        elif criterion == "Ends with":
+            ids = _prefix_range(self.suffix_keys, self.suffix_ids, value[::-1])
+        else:
+            raise ValueError(f"Criterion '{criterion}' is not indexed.")
+        hit = np.zeros(self.num_values + 1, dtype=bool)
+        hit[ids] = True
+        # Code -1 (missing) lands on the trailing False slot.
+        return hit[self.codes]
+
+
+def _prefix_range(keys, ids, prefix):
+    # Keys starting with prefix sort in [prefix, successor of prefix).
+    start = np.searchsorted(keys, prefix, "left")
+    stem = prefix.rstrip(chr(sys.maxunicode))
+    if not stem:
+        stop = len(keys)
+    else:
+        stop = np.searchsorted(keys, stem[:-1] + chr(ord(stem[-1]) + 1), "left")
+    return ids[start:stop]
+
+
+_builder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="excelfilter-index")
+_pending = set()
+# Columns found too large to index, so they are not queued again.
+_skipped = set()
+_pending_lock = threading.Lock()
+
+
+def trigram_index(dataset_id, column):
+    """The trigram index of a column if it has been built, else None."""
+    return workbook_cache().peek(("trigram_index", dataset_id, column))
+
+
+def affix_index(series, dataset_id, column):
+    """
+    The prefix/suffix index of a column if it has been built, else None. The
+    first call queues the build on the background thread.
+    """
+    key = ("affix_index", dataset_id, column)
+    index = workbook_cache().peek(key)
+    if (
+        index is None
+        and settings.AFFIX_INDEX
+        and len(series) >= settings.AFFIX_INDEX_MIN_ROWS
+    ):
+        _schedule(key, AffixIndex, series)
+    return index
+
+
+def build_text_indexes(df, dataset_id):
+    """
+    Queue trigram indexes for the text columns of a dataset on a background
+    thread. Safe to call on every rerun: built or queued columns are skipped.
+    """
+    if not settings.TRIGRAM_INDEX or len(df) < settings.TRIGRAM_INDEX_MIN_ROWS:
+        return
+    for column in df.columns:
+        # Categorical columns are already evaluated once per distinct value.
+        if df[column].dtype == "object" or isinstance(df[column].dtype, pd.StringDtype):
+            key = ("trigram_index", dataset_id, column)
+            _schedule(key, _trigram_index_or_none, df[column])
+
+
+def _trigram_index_or_none(series):
+    chars = int(series.drop_duplicates().str.len().sum())
+    if chars > settings.TRIGRAM_INDEX_MAX_CHARS:
+        logger.info("Not indexing %s: %d distinct characters", series.name, chars)
+        return None
+    return TrigramIndex(series)
+
+
+def _schedule(key, build, series):
+    with _pending_lock:
+        if key in _pending or key in _skipped:
+            return
+        if workbook_cache().peek(key) is not None:
+            return
+        _pending.add(key)
+    _builder.submit(_build, key, build, series)
+
+
+def _build(key, build, series):
+    try:
+        index = build(series)
+        if index is None:
+            with _pending_lock:
+                _skipped.add(key)
+        else:
+            workbook_cache().put(key, index)
+    except Exception:
+        logger.exception("Building index %s failed", key)
+    finally:
+        with _pending_lock:
+            _pending.discard(key)
@@ -0,0 +1,198 @@
+"""
+Optional per-rerun stage instrumentation: wall time, rows in and out, and
+memory allocated by each stage, kept for display and emitted as JSON log
+lines that can be aggregated across sessions.
+"""
+
+import datetime
+import json
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+import weakref
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+
+import pandas as pd
+
+from . import settings
+
+logger = logging.getLogger("excelfilter.stages")
+
+_tracing_lock = threading.Lock()
+# Instrumented runs tracing memory now, and whether this module started
+# tracemalloc (so it leaves tracing started by anything else alone).
+_tracing_runs = 0
+_tracing_owned = False
+
+
+@dataclass
+class StageRecord:
+    """
+    One measured stage.
+    Attributes:
+        stage: stage name, e.g. "apply_filters".
+        detail: optional qualifier, e.g. the filter column or export format.
+        rows_in: rows the stage started from, when it has any.
+        rows_out: rows it produced; set by the caller inside the stage.
+        seconds: wall time.
+        allocated_bytes: memory still allocated when the stage ended.
+        peak_bytes: highest memory allocated during the stage.
+        error: exception type name if the stage raised.
+    """
+
+    stage: str
+    detail: str = None
+    rows_in: int = None
+    rows_out: int = None
+    seconds: float = None
+    allocated_bytes: int = None
+    peak_bytes: int = None
+    error: str = None
+
+
+@lru_cache(maxsize=None)
+def stage_log():
+    """
+    The stage logger, with a JSON-lines handler when EXCELFILTER_STAGE_LOG
+    names a file ("-" for stderr); otherwise logging config decides.
+    """
+    if settings.STAGE_LOG:
+        handler = (
+            logging.StreamHandler(sys.stderr)
+            if settings.STAGE_LOG == "-"
+            else logging.FileHandler(settings.STAGE_LOG, encoding="utf-8")
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+def _start_tracing():
+    # Tracing slows allocations in every session, so it only runs while an
+    # instrumented run is in progress.
+    global _tracing_runs, _tracing_owned
+    with _tracing_lock:
+        if _tracing_runs == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_owned = True
+        _tracing_runs += 1
+
+
+def _stop_tracing():
+    global _tracing_runs, _tracing_owned
+    with _tracing_lock:
+        _tracing_runs -= 1
+        if _tracing_runs == 0 and _tracing_owned:
+            tracemalloc.stop()
+            _tracing_owned = False
+
+
+class StageRecorder:
+    """
+    Records the stages of one script run. When disabled, stage() costs a
+    context manager and records nothing.
+
+    Memory comes from tracemalloc, which sees pandas and NumPy buffers but
+    not Arrow's allocator. Tracing runs from the first instrumented recorder
+    until the last one is closed or collected. The traced peak is process-wide, so stages of
+    sessions running at the same time inflate each other's peaks.
+    """
+
+    def __init__(self, session_id=None, enabled=True, trace_memory=None):
+        self.session_id = session_id
+        self.run_id = uuid.uuid4().hex[:12]
+        self.enabled = enabled
+        self.records = []
+        if trace_memory is None:
+            trace_memory = settings.TRACE_MEMORY
+        self._finalizer = None
+        if enabled and trace_memory:
+            _start_tracing()
+            # Also stops tracing for runs ended by st.stop, st.rerun or an
+            # error, once the recorder is collected.
+            self._finalizer = weakref.finalize(self, _stop_tracing)
+
+    def close(self):
+        """End this run's memory tracing; stages recorded later get no memory."""
+        if self._finalizer is not None:
+            self._finalizer()
+
+    @contextmanager
+    def stage(self, name, detail=None, rows_in=None):
+        """
+        Measure the enclosed block.
+        Yields:
+            the StageRecord; set its rows_out before the block ends.
+        """
+        record = StageRecord(name, detail, rows_in)
+        if not self.enabled:
+            yield record
+            return
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        started = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record.error = type(e).__name__
+            raise
+        finally:
+            record.seconds = time.perf_counter() - started
+            if tracing:
+                current, peak = tracemalloc.get_traced_memory()
+                record.allocated_bytes = current - before
+                record.peak_bytes = max(peak - before, 0)
+            self.records.append(record)
+            self._log(record)
+
+    def _log(self, record):
+        log = stage_log()
+        if log.isEnabledFor(logging.INFO):
+            log.info(
+                json.dumps(
+                    {
+                        "event": "stage",
+                        "time": datetime.datetime.now(
+                            datetime.timezone.utc
+                        ).isoformat(),
+                        "session": self.session_id,
+                        "run": self.run_id,
+                        **asdict(record),
+                    },
+                    default=str,
+                )
+            )
+
+    @property
+    def total_seconds(self):
+        return sum(record.seconds for record in self.records)
+
+    def frame(self):
+        """The records as a DataFrame for display, in MB and milliseconds."""
+        return pd.DataFrame(
+            {
+                "Stage": [r.stage for r in self.records],
+                "Detail": [r.detail or "" for r in self.records],
+                "ms": [round(r.seconds * 1000, 1) for r in self.records],
+                "Rows in": pd.array([r.rows_in for r in self.records], dtype="Int64"),
+                "Rows out": pd.array([r.rows_out for r in self.records], dtype="Int64"),
+                "Allocated MB": [
+                    None if r.allocated_bytes is None else r.allocated_bytes / 2**20
+                    for r in self.records
+                ],
+                "Peak MB": [
+                    None if r.peak_bytes is None else r.peak_bytes / 2**20
+                    for r in self.records
+                ],
+                "Error": [r.error or "" for r in self.records],
+            }
+        )
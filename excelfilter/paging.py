@@ -0,0 +1,70 @@
+"""Server-side sorting and paging, so a view only materialises one page."""
+
+import numpy as np
+import pandas as pd
+
+from .cache import workbook_cache
+
+
+def _sorted_codes(series):
+    try:
+        return pd.factorize(series, sort=True, use_na_sentinel=True)
+    except TypeError:
+        # Mixed cell types do not compare; order them by their text.
+        text = series.where(series.isnull(), series.astype(str))
+        return pd.factorize(text, sort=True, use_na_sentinel=True)
+
+
+def _sort_order(series, ascending):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Category codes follow first appearance (or whatever order the
+        # categories were built in), so rank the category values instead.
+        ranks, uniques = _sorted_codes(pd.Series(series.cat.categories, dtype=object))
+        codes = series.cat.codes.to_numpy()
+        codes = np.where(codes < 0, -1, ranks[codes])
+    else:
+        codes, uniques = _sorted_codes(series)
+    ranks = codes.astype(np.int64)
+    if not ascending:
+        ranks = len(uniques) - 1 - ranks
+    # Missing cells sort last in both directions, as in sort_values.
+    ranks[codes < 0] = len(uniques)
+    order = np.argsort(ranks, kind="stable")
+    return order.astype(np.int32 if len(order) < 2**31 else np.int64)
+
+
+def sort_order(series, dataset_id=None, column=None, ascending=True):
+    """
+    Row positions of a column in sorted order, stable and with missing
+    cells last. Cached per dataset column when dataset_id is given.
+    """
+    if dataset_id is None:
+        return _sort_order(series, ascending)
+    return workbook_cache().get_or_load(
+        ("sort_order", dataset_id, column, ascending),
+        lambda: _sort_order(series, ascending),
+    )
+
+
+def view_positions(mask=None, order=None):
+    """
+    Positions of the rows a view shows, in display order.
+    Args:
+        mask: optional boolean row mask selecting the rows.
+        order: optional full-table sort order from sort_order.
+    Returns:
+        ndarray of positions, or None for every row in table order.
+    """
+    if order is None:
+        return None if mask is None else np.flatnonzero(mask)
+    # Filtering the full-table order keeps it sorted without a new sort.
+    return order if mask is None else order[mask[order]]
+
+
+def page_frame(df, positions, page, page_size):
+    """Rows [page * page_size, (page + 1) * page_size) of a view."""
+    start = page * page_size
+    stop = start + page_size
+    if positions is None:
+        return df.iloc[start:stop]
+    return df.iloc[positions[start:stop]]
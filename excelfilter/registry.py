@@ -0,0 +1,131 @@
+"""
+Process-wide record of which sessions use which datasets.
+
+Identical uploads already resolve to one parsed, shared copy: every cache
+entry is keyed by the workbook's content hash. The registry adds reference
+counts per session, so the memory-bounded caches evict the entries of
+datasets no live session uses before any entry of a dataset in use.
+"""
+
+import threading
+import time
+from functools import lru_cache
+
+
+def key_parts(key):
+    """The strings in a cache key, nested tuples included (digests among them)."""
+    if isinstance(key, tuple):
+        for part in key:
+            yield from key_parts(part)
+    elif isinstance(key, str):
+        yield key
+
+
+class DatasetRegistry:
+    """
+    Datasets (workbook content digests) referenced by each session.
+
+    Cached frames are shared between sessions as they are and must never be
+    modified in place; every code path derives new frames instead.
+    """
+
+    def __init__(self, is_live=None):
+        # Optional callable(session_id) -> bool; sessions it reports as gone
+        # are forgotten the next time any session records its datasets.
+        self.is_live = is_live
+        self._sessions = {}
+        self._refcounts = {}
+        self._last_seen = {}
+        self._lock = threading.Lock()
+
+    def use(self, session_id, digests):
+        """
+        Record the datasets a session holds now, replacing the ones it held
+        before, and release those of sessions that are no longer live.
+        Args:
+            session_id: id of the session; None records nothing.
+            digests: content digests of the workbooks the session has open.
+        """
+        if session_id is None:
+            return
+        digests = frozenset(digests)
+        dead = self._dead_sessions(exclude=session_id)
+        with self._lock:
+            for dead_id in dead:
+                self._drop(dead_id)
+            self._drop(session_id)
+            if digests:
+                self._sessions[session_id] = digests
+                self._last_seen[session_id] = time.monotonic()
+                for digest in digests:
+                    self._refcounts[digest] = self._refcounts.get(digest, 0) + 1
+
+    def release(self, session_id):
+        """Forget a session and drop its references."""
+        with self._lock:
+            self._drop(session_id)
+
+    def _drop(self, session_id):
+        self._last_seen.pop(session_id, None)
+        for digest in self._sessions.pop(session_id, ()):
+            count = self._refcounts[digest] - 1
+            if count:
+                self._refcounts[digest] = count
+            else:
+                del self._refcounts[digest]
+
+    def _dead_sessions(self, exclude=None):
+        if self.is_live is None:
+            return []
+        with self._lock:
+            session_ids = list(self._sessions)
+        return [
+            session_id
+            for session_id in session_ids
+            if session_id != exclude and not self.is_live(session_id)
+        ]
+
+    def refcount(self, digest):
+        with self._lock:
+            return self._refcounts.get(digest, 0)
+
+    def sessions(self, digest=None):
+        """Ids of the sessions holding digest, or of every registered session."""
+        with self._lock:
+            return [
+                session_id
+                for session_id, digests in self._sessions.items()
+                if digest is None or digest in digests
+            ]
+
+    def datasets(self, session_id):
+        """Digests of the datasets a session holds."""
+        with self._lock:
+            return self._sessions.get(session_id, frozenset())
+
+    def idle_seconds(self, session_id):
+        """Seconds since the session last recorded its datasets, or None."""
+        with self._lock:
+            last_seen = self._last_seen.get(session_id)
+        return None if last_seen is None else time.monotonic() - last_seen
+
+    def in_use(self, key):
+        """Whether a cache key belongs to a dataset some session holds."""
+        with self._lock:
+            if not self._refcounts:
+                return False
+            return any(part in self._refcounts for part in key_parts(key))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "datasets": len(self._refcounts),
+                "sessions": len(self._sessions),
+                "references": sum(self._refcounts.values()),
+            }
+
+
+@lru_cache(maxsize=None)
+def dataset_registry():
+    """Process-wide registry shared by every Streamlit session."""
+    return DatasetRegistry()
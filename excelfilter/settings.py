@@ -0,0 +1,91 @@
+"""Tunables read from the environment so deployments can size the caches."""
+
+import os
+
+
+def _env_flag(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ("0", "false", "no", "off", "")
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+# Memory budget for parsed workbooks shared by every session of the process.
+WORKBOOK_CACHE_MB = _env_int("EXCELFILTER_WORKBOOK_CACHE_MB", 1024)
+
+# Memory budget for filter results (one byte per row) shared by every session.
+MASK_CACHE_MB = _env_int("EXCELFILTER_MASK_CACHE_MB", 256)
+
+# Text columns whose distinct values are at most this fraction of their rows
+# are loaded dictionary-encoded (pandas Categorical).
+DICTIONARY_MAX_RATIO = _env_float("EXCELFILTER_DICTIONARY_MAX_RATIO", 0.5)
+
+# Directory and size cap for parsed sheets spilled to Arrow IPC files. A size
+# of 0 disables the disk cache.
+DISK_CACHE_DIR = os.environ.get(
+    "EXCELFILTER_DISK_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "excelfilter"),
+)
+DISK_CACHE_MB = _env_int("EXCELFILTER_DISK_CACHE_MB", 4096)
+
+# Build a sorted index the first time a numeric column of at least this many
+# rows is filtered, turning comparisons into binary searches.
+SORTED_INDEX = _env_flag("EXCELFILTER_SORTED_INDEX", True)
+SORTED_INDEX_MIN_ROWS = _env_int("EXCELFILTER_SORTED_INDEX_MIN_ROWS", 100_000)
+
+# Build trigram indexes for "Contains" in the background for text columns of
+# at least this many rows, unless their distinct values hold more characters
+# than the cap.
+TRIGRAM_INDEX = _env_flag("EXCELFILTER_TRIGRAM_INDEX", True)
+TRIGRAM_INDEX_MIN_ROWS = _env_int("EXCELFILTER_TRIGRAM_INDEX_MIN_ROWS", 50_000)
+TRIGRAM_INDEX_MAX_CHARS = _env_int("EXCELFILTER_TRIGRAM_INDEX_MAX_CHARS", 10_000_000)
+
+# Build prefix/suffix indexes for "Starts with" / "Ends with" in the
+# background the first time a text column of at least this many rows uses them.
+AFFIX_INDEX = _env_flag("EXCELFILTER_AFFIX_INDEX", True)
+AFFIX_INDEX_MIN_ROWS = _env_int("EXCELFILTER_AFFIX_INDEX_MIN_ROWS", 50_000)
+
+# Memory budget for export files prepared for download, shared by every
+# session, so each distinct filtered result is written at most once.
+EXPORT_CACHE_MB = _env_int("EXCELFILTER_EXPORT_CACHE_MB", 256)
+
+# Size cap for export files written to disk in constant memory, kept under
+# DISK_CACHE_DIR/exports. A size of 0 disables the on-disk export mode.
+EXPORT_FILES_MB = _env_int("EXCELFILTER_EXPORT_FILES_MB", 2048)
+
+# Rows per sheet (or per workbook when split into files) of an Excel export;
+# larger results are split. Capped at Excel's limit of 1,048,575 data rows.
+EXPORT_PART_ROWS = _env_int("EXCELFILTER_EXPORT_PART_ROWS", 1_048_575)
+
+# Record per-stage wall time, rows and memory for each rerun; the app's
+# sidebar toggle starts from this default.
+INSTRUMENT = _env_flag("EXCELFILTER_INSTRUMENT", False)
+
+# Measure stage memory with tracemalloc while instrumenting. Tracing slows
+# allocations in every session while any instrumented run is in progress.
+TRACE_MEMORY = _env_flag("EXCELFILTER_TRACE_MEMORY", True)
+
+# File receiving one JSON line per instrumented stage ("-" for stderr). When
+# empty, the "excelfilter.stages" logger follows the logging configuration.
+STAGE_LOG = os.environ.get("EXCELFILTER_STAGE_LOG", "")
+
+# Ceiling on the cached data of the datasets sessions hold, summed over the
+# workbook, mask and export caches. Above it, the largest sessions idle for
+# SESSION_IDLE_SECONDS have their data spilled to the disk cache and
+# reloaded on their next rerun. A ceiling of 0 disables the governor.
+SESSION_MEMORY_MB = _env_int("EXCELFILTER_SESSION_MEMORY_MB", 768)
+SESSION_IDLE_SECONDS = _env_int("EXCELFILTER_SESSION_IDLE_SECONDS", 300)
@@ -0,0 +1,240 @@
+"""Streaming .xlsx ingest: openpyxl read-only rows into an Arrow column buffer."""
+
+from io import BytesIO
+
+import openpyxl
+import pyarrow as pa
+import pyarrow.compute as pc
+
+DEFAULT_BATCH_ROWS = 5000
+
+# Strings pd.read_excel treats as missing with its default na_values.
+_NA_STRINGS = frozenset(
+    [
+        "",
+        "#N/A",
+        "#N/A N/A",
+        "#NA",
+        "-1.#IND",
+        "-1.#QNAN",
+        "-NaN",
+        "-nan",
+        "1.#IND",
+        "1.#QNAN",
+        "<NA>",
+        "N/A",
+        "NA",
+        "NULL",
+        "NaN",
+        "None",
+        "n/a",
+        "nan",
+        "null",
+    ]
+)
+
+
+def _clean_cell(value):
+    # Same cell normalisation pd.read_excel applies with the openpyxl engine.
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value in _NA_STRINGS:
+        return None
+    return value
+
+
+def _text_array(values):
+    # Mixed cell types are kept as text, each cell formatted by str().
+    return pa.array([None if v is None else str(v) for v in values], pa.string())
+
+
+def _to_array(values):
+    types = {type(v) for v in values if v is not None}
+    if bool in types and len(types) > 1:
+        # Arrow would read True as 1 among numbers.
+        return _text_array(values)
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return _text_array(values)
+
+
+def _unify(chunks):
+    types = {chunk.type for chunk in chunks}
+    if len(types) == 1:
+        target = types.pop()
+    else:
+        try:
+            target = (
+                pa.unify_schemas(
+                    [pa.schema([("c", t)]) for t in types], promote_options="permissive"
+                )
+                .field("c")
+                .type
+            )
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            target = pa.string()
+    if pa.types.is_null(target):
+        # An all-empty column reads as float NaN, as with pd.read_excel.
+        target = pa.float64()
+    elif pa.types.is_boolean(target) and any(chunk.null_count for chunk in chunks):
+        # pd.read_excel reads booleans with gaps as 1.0 / 0.0 / NaN.
+        target = pa.float64()
+    if pa.types.is_string(target):
+        # Format batches of other types from their Python values, as a batch
+        # that mixed types was, rather than with Arrow's cast ("true", ...).
+        chunks = [
+            chunk if pa.types.is_string(chunk.type) else _text_array(chunk.to_pylist())
+            for chunk in chunks
+        ]
+    return pa.chunked_array([chunk.cast(target) for chunk in chunks], target)
+
+
+def table_to_frame(table):
+    """Convert a sheet table to the pandas layout pd.read_excel produces."""
+    return table.to_pandas(coerce_temporal_nanoseconds=True, split_blocks=True)
+
+
+def dictionary_encode(table, max_ratio):
+    """
+    Dictionary-encode the text columns whose distinct values are at most
+    max_ratio of the rows; they convert to pandas Categorical.
+    """
+    for i, field in enumerate(table.schema):
+        column = table.column(i)
+        if not pa.types.is_string(field.type) or len(column) == 0:
+            continue
+        if pc.count_distinct(column).as_py() <= max_ratio * len(column):
+            encoded = column.combine_chunks().dictionary_encode()
+            table = table.set_column(i, field.name, encoded)
+    return table
+
+
+class ColumnarBuffer:
+    """Row batches stored column by column as Arrow arrays."""
+
+    def __init__(self, header=()):
+        self.columns = []
+        self.chunks = []
+        self.num_rows = 0
+        self._add_columns(header)
+
+    def _add_columns(self, names):
+        seen = set(self.columns)
+        for name in names:
+            name = f"Unnamed: {len(self.columns)}" if name is None else str(name)
+            unique, suffix = name, 1
+            while unique in seen:
+                unique, suffix = f"{name}.{suffix}", suffix + 1
+            seen.add(unique)
+            self.columns.append(unique)
+            self.chunks.append([pa.nulls(self.num_rows)] if self.num_rows else [])
+
+    def append(self, rows):
+        """Add a batch of row tuples, widening the buffer for longer rows."""
+        if not rows:
+            return
+        width = max(len(row) for row in rows)
+        if width > len(self.columns):
+            self._add_columns([None] * (width - len(self.columns)))
+        for i, chunks in enumerate(self.chunks):
+            chunks.append(_to_array([row[i] if i < len(row) else None for row in rows]))
+        self.num_rows += len(rows)
+
+    def to_table(self):
+        return pa.table(
+            {
+                name: _unify(chunks) if chunks else pa.nulls(0, pa.float64())
+                for name, chunks in zip(self.columns, self.chunks)
+            }
+        )
+
+    def to_pandas(self):
+        return table_to_frame(self.to_table())
+
+    def head(self, n):
+        """First n buffered rows as a DataFrame, for previews while reading."""
+        columns = {}
+        for name, chunks in zip(self.columns, self.chunks):
+            taken, parts = 0, []
+            for chunk in chunks:
+                if taken >= n:
+                    break
+                parts.append(chunk.slice(0, n - taken))
+                taken += len(parts[-1])
+            columns[name] = _unify(parts) if parts else pa.nulls(0, pa.float64())
+        return table_to_frame(pa.table(columns))
+
+
+def iter_row_batches(data, sheet_name, batch_size=DEFAULT_BATCH_ROWS):
+    """
+    Stream the rows of one worksheet in fixed-size batches.
+    Args:
+        data: raw bytes of the workbook.
+        sheet_name: worksheet to read.
+        batch_size: number of data rows per batch, roughly.
+    Yields:
+        (rows, total_rows) where rows is a list of cleaned value tuples and
+        total_rows is the row count declared by the sheet, or None if unknown.
+        The first batch holds only the header row.
+    """
+    book = openpyxl.load_workbook(
+        BytesIO(data), read_only=True, data_only=True, keep_links=False
+    )
+    try:
+        sheet = book[sheet_name]
+        total_rows = sheet.max_row
+        # The stored dimension can be stale, so read every row that exists.
+        sheet.reset_dimensions()
+        batch, header_sent, blank_rows = [], False, 0
+        for row in sheet.iter_rows(values_only=True):
+            row = [_clean_cell(value) for value in row]
+            while row and row[-1] is None:
+                row.pop()
+            if not row:
+                # Blank rows inside the data are kept as empty rows, as
+                # pd.read_excel does; those before the header or after the
+                # last data row are dropped.
+                blank_rows += header_sent
+                continue
+            if not header_sent:
+                yield [tuple(row)], total_rows
+                header_sent = True
+                continue
+            batch.extend([[]] * blank_rows)
+            blank_rows = 0
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch, total_rows
+                batch = []
+        if batch:
+            yield batch, total_rows
+    finally:
+        book.close()
+
+
+def read_sheet_table(data, sheet_name, batch_size=DEFAULT_BATCH_ROWS, on_batch=None):
+    """
+    Read a worksheet through the streaming path into an Arrow table.
+    Args:
+        data: raw bytes of the workbook.
+        sheet_name: worksheet to read.
+        batch_size: rows per batch.
+        on_batch: optional callable(buffer, total_rows) invoked after each batch.
+    Returns:
+        pa.Table with the first non-empty row used as the header.
+    """
+    buffer = None
+    for rows, total_rows in iter_row_batches(data, sheet_name, batch_size):
+        if buffer is None:
+            buffer = ColumnarBuffer(rows[0])
+            continue
+        buffer.append(rows)
+        if on_batch is not None:
+            on_batch(buffer, total_rows)
+    return (buffer or ColumnarBuffer()).to_table()
+
+
+def read_sheet(data, sheet_name, batch_size=DEFAULT_BATCH_ROWS, on_batch=None):
+    """Same as read_sheet_table, converted to a DataFrame."""
+    return table_to_frame(read_sheet_table(data, sheet_name, batch_size, on_batch))
@@ -0,0 +1,219 @@
+"""Workbooks whose sheets are parsed one at a time, on first access."""
+
+import logging
+import multiprocessing
+import os
+import posixpath
+import zipfile
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from xml.etree import ElementTree
+
+from . import settings
+from .cache import content_hash, upload_digest, workbook_cache
+from .diskcache import disk_cache
+from .dtypes import optimize_dtypes
+
+logger = logging.getLogger(__name__)
+
+_OFFICE_DOCUMENT = "/officeDocument"
+_WORKSHEET = "/worksheet"
+
+# Below this size parsing sheets in-process beats starting worker processes.
+PARALLEL_PARSE_MIN_BYTES = 1024 * 1024
+
+
+def _relationships(archive, part):
+    """Map relationship ids of an OOXML part to (type, target path)."""
+    folder, name = posixpath.split(part)
+    rels_path = posixpath.join(folder, "_rels", f"{name}.rels")
+    root = ElementTree.fromstring(archive.read(rels_path))
+    rels = {}
+    for rel in root.iterfind("{*}Relationship"):
+        target = rel.get("Target")
+        if target.startswith("/"):
+            target = target[1:]
+        else:
+            target = posixpath.normpath(posixpath.join(folder, target))
+        rels[rel.get("Id")] = (rel.get("Type"), target)
+    return rels
+
+
+def read_sheet_names(data):
+    """
+    List the worksheets of an .xlsx from the workbook metadata alone.
+    Args:
+        data: raw bytes of the workbook.
+    Returns:
+        Worksheet names in workbook order, without parsing any cell data.
+    """
+    with zipfile.ZipFile(BytesIO(data)) as archive:
+        workbook_part = next(
+            target
+            for rel_type, target in _relationships(archive, "").values()
+            if rel_type.endswith(_OFFICE_DOCUMENT)
+        )
+        rels = _relationships(archive, workbook_part)
+        root = ElementTree.fromstring(archive.read(workbook_part))
+    names = []
+    for sheet in root.iterfind(".//{*}sheet"):
+        rel_id = next(
+            (value for key, value in sheet.attrib.items() if key.endswith("}id")),
+            None,
+        )
+        rel_type = rels.get(rel_id, ("",))[0]
+        if rel_type.endswith(_WORKSHEET):
+            names.append(sheet.get("name"))
+    return names
+
+
+class LazyWorkbook(Mapping):
+    """
+    Read-only mapping of sheet name to DataFrame.
+
+    Sheet names come from the workbook metadata; a sheet is parsed the first
+    time it is looked up, with low-cardinality text columns dictionary-encoded,
+    spilled to the disk cache and kept in the shared workbook cache.
+    """
+
+    def __init__(self, data, digest=None):
+        self.data = data
+        self.digest = digest or content_hash(data)
+        self.sheet_names = read_sheet_names(data)
+        self.nbytes = len(data)
+
+    def sheet_key(self, sheet_name):
+        return _sheet_key(self.digest, sheet_name)
+
+    def load(self, sheet_name, on_batch=None):
+        """
+        Return a parsed sheet, streaming it from the workbook on a cache miss.
+        Args:
+            sheet_name: worksheet to load.
+            on_batch: optional progress callback, see streaming.read_sheet.
+        Returns:
+            DataFrame with the sheet contents.
+        """
+        if sheet_name not in self.sheet_names:
+            raise KeyError(sheet_name)
+        return workbook_cache().get_or_load(
+            self.sheet_key(sheet_name),
+            lambda: self._read(sheet_name, on_batch),
+        )
+
+    def load_optimized(self, sheet_name, on_batch=None):
+        """
+        Return a sheet with optimize_dtypes applied, computed once. The
+        optimised frame replaces the parsed one in the shared cache, so only
+        one copy is held; the parsed frame is memory-mapped back from the
+        disk cache if a session asks for it again.
+        Args:
+            sheet_name: worksheet to load.
+            on_batch: optional progress callback, see streaming.read_sheet.
+        Returns:
+            (DataFrame, {"before": bytes, "after": bytes})
+        """
+        key = self.sheet_key(sheet_name)
+        cache = workbook_cache()
+        result = cache.get(("optimized", key))
+        if result is None:
+            result = cache.put(
+                ("optimized", key), optimize_dtypes(self.load(sheet_name, on_batch))
+            )
+            cache.pop(key)
+        return result
+
+    def _read(self, sheet_name, on_batch):
+        # Reuse a table spilled by an earlier session before parsing the xlsx.
+        key = self.sheet_key(sheet_name)
+        table = disk_cache().load(key)
+        if table is None:
+            table = _parse_sheet(self.data, sheet_name, on_batch)
+            try:
+                disk_cache().store(key, table)
+            except OSError:
+                # Read-only, missing or full cache directory: keep the table.
+                logger.warning("Could not spill sheet %r to disk", key, exc_info=True)
+        from .streaming import table_to_frame
+
+        return table_to_frame(table)
+
+    def preload(self, sheet_names=None, max_workers=None):
+        """
+        Parse the sheets found in neither cache in parallel processes and
+        spill them to the disk cache, so that load() only memory-maps them.
+        Does nothing without a disk cache, for small workbooks or when only
+        one worker would run.
+        Args:
+            sheet_names: sheets to preload; defaults to every sheet.
+            max_workers: processes to use; defaults to one per CPU.
+        """
+        if not disk_cache().enabled or self.nbytes < PARALLEL_PARSE_MIN_BYTES:
+            return
+        names = [
+            name
+            for name in (self.sheet_names if sheet_names is None else sheet_names)
+            if workbook_cache().peek(self.sheet_key(name)) is None
+            and disk_cache().file_path(self.sheet_key(name)) is None
+        ]
+        max_workers = min(len(names), max_workers or os.cpu_count() or 1)
+        if max_workers < 2:
+            return
+        # Spawned workers do not inherit the locks of the server's threads.
+        context = multiprocessing.get_context("spawn")
+        try:
+            # The workbook bytes go to each worker once, not with every task.
+            with ProcessPoolExecutor(
+                max_workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self.data, self.digest),
+            ) as pool:
+                list(pool.map(_spill_sheet, names))
+        except Exception:
+            # load() parses whatever is still missing in this process.
+            logger.exception("Parsing sheets in worker processes failed")
+
+    def __getitem__(self, sheet_name):
+        return self.load(sheet_name)
+
+    def __iter__(self):
+        return iter(self.sheet_names)
+
+    def __len__(self):
+        return len(self.sheet_names)
+
+
+def _sheet_key(digest, sheet_name):
+    return ("sheet", digest, sheet_name)
+
+
+def _parse_sheet(data, sheet_name, on_batch=None):
+    # openpyxl and the Arrow kernels are only loaded once a sheet is parsed.
+    from .streaming import dictionary_encode, read_sheet_table
+
+    table = read_sheet_table(data, sheet_name, on_batch=on_batch)
+    return dictionary_encode(table, settings.DICTIONARY_MAX_RATIO)
+
+
+# Workbook (data, digest) of a preload worker process, set by _init_worker.
+_worker_workbook = None
+
+
+def _init_worker(data, digest):
+    global _worker_workbook
+    _worker_workbook = (data, digest)
+
+
+def _spill_sheet(sheet_name):
+    data, digest = _worker_workbook
+    disk_cache().store(_sheet_key(digest, sheet_name), _parse_sheet(data, sheet_name))
+
+
+def open_workbook(uploaded_file):
+    """Return the cached LazyWorkbook for an upload, creating it on first use."""
+    digest = upload_digest(uploaded_file)
+    return workbook_cache().get_or_load(
+        ("workbook", digest), lambda: LazyWorkbook(uploaded_file.getvalue(), digest)
+    )
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from excelfilter.indexes import TRIGRAM_CHUNK_CHARS, TrigramIndex
+
+
+def expected(series, needle):
+    return series.str.contains(needle, case=False, regex=False, na=False).to_numpy(
+        dtype=bool
+    )
+
+
+def test_single_value_column():
+    series = pd.Series(["Active"] * 60_000, dtype=object)
+    index = TrigramIndex(series)
+    for needle in ("act", "ACTIVE", "tiv", "xyz", "ac"):
+        np.testing.assert_array_equal(index.contains(needle), expected(series, needle))
+
+
+@pytest.mark.parametrize("needle", ["ref-0001", "alpha", "LPH", "9 b", "é", "zzz"])
+def test_multi_chunk_column(needle):
+    rng = np.random.default_rng(0)
+    words = np.array(["alpha", "bravo", "délta", None], dtype=object)
+    values = [
+        None if word is None else f"ref-{number:08d} {word}"
+        for number, word in zip(
+            rng.integers(0, 10**8, 60_000), words[rng.integers(0, 4, 60_000)]
+        )
+    ]
+    series = pd.Series(values, dtype=object)
+    assert series.dropna().str.len().sum() > 2 * TRIGRAM_CHUNK_CHARS
+    index = TrigramIndex(series)
+    np.testing.assert_array_equal(index.contains(needle), expected(series, needle))